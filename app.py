@@ -3,99 +3,282 @@
 #----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+import click
+from flask import Flask, Blueprint, current_app, render_template, request, Response, flash, redirect, url_for, abort, jsonify
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from flask_migrate import Migrate
+from config import get_config
+from extensions import db, migrate, moment
+
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+# Following the Rubrics:
+# Code is decoupled into relevant parts across the files to construct a well-organized code base.
+from models import * 
+from queries import *
+from search import find_by_name, indexed_show_search_ids
+from search_index import search_indexes
+from pagination import paginate_request
+from genres import genre_cache
+from formatting import format_datetime, format_datetimes
+from page_cache import page_cache
+from payloads import *
+from streaming import json_stream_response, stream_query
+from metrics import request_metrics
+from profiler import request_profiler
+from replicas import replicas
+from conditional import conditional_requests, venue_validator, artist_validator, \
+  venues_validator, artists_validator, shows_validator
+from importer import import_file, LOADERS
+from exporter import export_tables, next_since, TABLES
+from rollups import count_new_shows, roll_show_counts, rebuild_show_counts
+from assets import assets
+from compression import response_compression
+from template_cache import template_cache
+
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-mirgrate = Migrate(app, db)
+# The views below are registered on the `main` blueprint; `create_app()` builds an
+# application around it for one of the configuration profiles in config.py
+# (FYYUR_ENV=development|testing|production|memory). `flask` finds `create_app()` by itself.
+bp = Blueprint('main', __name__, cli_group=None)
+
+def create_app(profile=None, **overrides):
+  # `overrides` are config values set on top of the profile, e.g. SQLALCHEMY_DATABASE_URI
+  app = Flask(__name__)
+  app.config.from_object(get_config(profile))
+  app.config.update(overrides)
+  if not app.config.get('SECRET_KEY'):
+    raise RuntimeError('SECRET_KEY is not set')
+
+  # TODO: connect to a local postgresql database - DONE
+  db.init_app(app)
+  migrate.init_app(app, db)
+  moment.init_app(app)
+
+  # Bundled, hashed and precompressed CSS/JS under static/dist/, linked with asset_url() (see assets.py)
+  assets.init_app(app)
+
+  # Compiled templates kept on disk, and the rows of the listings cached by version (see template_cache.py)
+  template_cache.init_app(app)
+
+  # Optional in-process n-gram index over venue and artist names (SEARCH_INDEX_ENABLED, see search_index.py)
+  search_indexes.init_app(app)
+  # Read-only views read from a replica when REPLICA_BINDS are configured (see replicas.py)
+  replicas.init_app(app)
+  # Rendered pages of the listings and detail pages (PAGE_CACHE_BACKEND, see page_cache.py)
+  page_cache.init_app(app)
+  # ETags and Last-Modified of the listings and detail pages, 304 for unchanged ones (see conditional.py)
+  conditional_requests.init_app(app)
+  # gzip/brotli of the HTML and JSON responses, streamed ones chunk by chunk (see compression.py)
+  response_compression.init_app(app)
+  # Queries, SQL time and template time of every request, per endpoint, at /metrics (see metrics.py)
+  request_metrics.init_app(app, db)
+  # Profiles single requests that carry a signed token (PROFILER_ENABLED, see profiler.py)
+  request_profiler.init_app(app, db)
+
+  app.register_blueprint(bp)
+
+  if not app.debug and not app.testing:
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
+    app.logger.info('errors')
 
-# TODO: connect to a local postgresql database - DONE
+  return app
 
 #----------------------------------------------------------------------------#
-# Models.
+# Search Index.
 #----------------------------------------------------------------------------#
 
-# Following the Rubrics:
-# Code is decoupled into relevant parts across the files to construct a well-organized code base.
-from models import * 
+# Each worker builds the index on its first search when SEARCH_INDEX_ENABLED (see search_index.py);
+# the commands below build it in the CLI process
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+  """Builds the venue and artist name indexes in this process and prints their stats (workers keep their own up to date)."""
+  search_indexes.rebuild()
+  print(json.dumps(search_indexes.stats(), indent=2))
+
+@bp.cli.command('search-index-stats')
+def search_index_stats_command():
+  """Builds the venue and artist name indexes, then prints their size and search latency."""
+  search_indexes.rebuild()
+  for term in ('a', 'the', 'music', 'band'):
+    search_indexes.venues.search(term)
+    search_indexes.artists.search(term)
+  print(json.dumps(search_indexes.stats(), indent=2))
 
 #----------------------------------------------------------------------------#
-# Filters.
+# Bulk Import.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  # Adding locale='en' in format_datetime() solved: AttributeError: 'NoneType' object has no attribute 'days'
-  return babel.dates.format_datetime(date, format, locale='en')
+@bp.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(LOADERS)))
+@click.argument('path')
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Default: from the file name')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per transaction')
+@click.option('--dry-run', is_flag=True, help='Only validate the rows')
+@click.option('--show-rejected', default=20, show_default=True, help='Rejected rows to print')
+def import_data_command(kind, path, format, batch_size, dry_run, show_rejected):
+  """Imports venues, artists, shows or genres from a CSV or JSON Lines file (see importer.py)."""
+  report = import_file(kind, path, format=format, batch_size=batch_size, dry_run=dry_run)
+  for line, errors in report.rejected[:show_rejected]:
+    click.echo('line %d: %s' % (line, '; '.join('%s: %s' % (field, ', '.join(map(str, messages))) for field, messages in errors.items())), err=True)
+  if len(report.rejected) > show_rejected:
+    click.echo('... and %d more rejected rows' % (len(report.rejected) - show_rejected), err=True)
+  click.echo(report.summary())
+
+  # Workers sharing the page cache (PAGE_CACHE_BACKEND 'filesystem') drop the listings;
+  # the detail pages of venues and artists with imported shows catch up within PAGE_CACHE_TIMEOUT
+  if report.imported and not dry_run:
+    page_cache.invalidate(*{'venues': ['venues'], 'artists': ['artists'], 'shows': ['shows', 'venues'], 'genres': []}[kind])
 
-app.jinja_env.filters['datetime'] = format_datetime
+#----------------------------------------------------------------------------#
+# Bulk Export.
+#----------------------------------------------------------------------------#
+
+@bp.cli.command('export-data')
+@click.option('--output-dir', default='export', show_default=True, help='Directory of the <table>.csv/.jsonl files')
+@click.option('--tables', default=','.join(TABLES), show_default=True, help='Comma separated tables to export')
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Write .gz files')
+@click.option('--since', help='Only rows changed since this UTC time, e.g. "2026-10-17 02:00:00"')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows fetched from the cursor at a time')
+def export_data_command(output_dir, tables, format, compress, since, batch_size):
+  """Streams venues, artists, shows and genres to CSV or JSON Lines files (see exporter.py)."""
+  tables = [table.strip() for table in tables.split(',') if table.strip()]
+  unknown = set(tables) - set(TABLES)
+  if unknown:
+    raise click.BadParameter('unknown tables: %s' % ', '.join(sorted(unknown)), param_hint='--tables')
+  try:
+    since = datetime.fromisoformat(since) if since else None
+  except ValueError:
+    raise click.BadParameter('expected a time like "2026-10-17 02:00:00"', param_hint='--since')
+
+  started = datetime.utcnow()
+  # Dumps are read from a replica when there is one (see replicas.py)
+  engine = db.get_engine(bind=replicas.binds[0]) if replicas.enabled else db.engine
+  for table, path, count, seconds in export_tables(engine, output_dir, tables, format, compress, since, batch_size):
+    click.echo('%s: %d rows to %s in %.2fs (%.0f rows/s)' % (table, count, path, seconds, count / seconds if seconds else 0))
+  # Overlaps this run, for the rows committed after it read them (see exporter.py)
+  click.echo('Next incremental export: --since "%s"' % next_since(started).isoformat(sep=' ', timespec='seconds'))
+
+#----------------------------------------------------------------------------#
+# Show Count Rollups.
+#----------------------------------------------------------------------------#
+
+@bp.cli.command('roll-show-counts')
+@click.option('--rebuild', is_flag=True, help='Count every show again instead of rolling')
+def roll_show_counts_command(rebuild):
+  """Moves the shows that started since the last run from upcoming to past (see rollups.py).
+
+  Meant to run every few minutes, e.g. from cron: */5 * * * * flask roll-show-counts
+  """
+  if rebuild:
+    click.echo('Counted %d shows' % rebuild_show_counts())
+  else:
+    click.echo('Moved %d shows to past' % roll_show_counts())
+  # /venues shows the upcoming counts
+  page_cache.invalidate('venues')
+
+#----------------------------------------------------------------------------#
+# Static Assets.
+#----------------------------------------------------------------------------#
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+  """Builds the hashed, minified and precompressed bundles of static/dist/ (see assets.py)."""
+  for name, path in sorted(assets.build().items()):
+    click.echo('%-40s %s' % (name, path))
+
+@bp.cli.command('compile-templates')
+def compile_templates_command():
+  """Compiles every template into the bytecode cache, so workers start warm (see template_cache.py)."""
+  click.echo('Compiled %d templates' % template_cache.compile_templates(current_app))
+
+#----------------------------------------------------------------------------#
+# Page Cache.
+#----------------------------------------------------------------------------#
+
+# Called by the submissions once their changes are committed, to drop exactly the pages showing them
+
+def invalidate_venue_pages(venue_id):
+  # The venue's page, the listings showing its name, and the pages of the artists that played there
+  if page_cache.enabled:
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+    page_cache.invalidate('venues', 'shows', 'venue:%d' % venue_id, *['artist:%d' % id for (id,) in artist_ids])
+
+def invalidate_artist_pages(artist_id):
+  # The artist's page, the listings showing its name, and the pages of the venues it played at
+  if page_cache.enabled:
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+    page_cache.invalidate('artists', 'shows', 'artist:%d' % artist_id, *['venue:%d' % id for (id,) in venue_ids])
+
+def invalidate_show_pages(venue_id, artist_id):
+  # /shows, the upcoming show counts on /venues, and the pages of the show's venue and artist
+  page_cache.invalidate('shows', 'venues', 'venue:%d' % venue_id, 'artist:%d' % artist_id)
+
+@bp.route('/cache/stats')
+def page_cache_stats():
+  return jsonify(dict(page_cache.stats(), fragments=template_cache.stats()))
+
+#----------------------------------------------------------------------------#
+# Filters.
+#----------------------------------------------------------------------------#
+
+# `format_datetime()` takes datetime objects or strings, see formatting.py
+bp.add_app_template_filter(format_datetime, 'datetime')
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
 def index():
   return render_template('pages/home.html')
 
+def detail_shows_page(query, when):
+  # The page of a venue's/artist's upcoming or past shows after the ?after= cursor (see `shows_page()`)
+  try:
+    return shows_page(query, when, datetime.now(), after=request.args.get('after'),
+      per_page=current_app.config['DETAIL_PAGE_SHOWS'])
+  except ValueError:
+    abort(400)
+
+def render_more_shows(tiles, title, shows, next_url):
+  # "Load more" of a venue/artist page: just the show tiles when fetched by script.js (?partial=1),
+  # a page of them otherwise
+  if request.args.get('partial'):
+    return render_template(tiles, shows=shows, next_url=next_url)
+  return render_template('pages/more_shows.html', tiles=tiles, title=title, shows=shows, next_url=next_url)
+
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
+@replicas.read_only
+@conditional_requests.conditional(venues_validator)
+@page_cache.cached('venues')
 def venues():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue. DONE
   
-  # Querying all the venues
-  venues = Venue.query.all()
-
-  # Initializations
-  data = []
-  city_and_state = set() # to uniquely identify the city and state
-
-  # Looping over `venues` to uniquely identify the city and state
-  for venue in venues:
-    city_and_state.add( (venue.city, venue.state) )
-
-  # Looping over `city_and_state` to display venues based on City and State
-  for place in city_and_state:
-    list_of_venues = []
-    
-    # Aggregating venues for each `city_and_state` combination
-    for venue in venues:
-      if( venue.city == place[0] and venue.state == place[1]):
-        list_of_venues.append({
-          'id': venue.id,
-          'name': venue.name,
-          'num_upcoming_shows': 0
-        })
-
-    # Data to be sent
-    data.append({
-      'city':place[0],
-      'state': place[1],
-      'venues': list_of_venues
-      }
-    )
+  # One grouped query per page: venues sorted by (city, state) with the number of upcoming shows
+  # of each venue counted by the database. See `venue_areas_query()` in queries.py
+  # Pages are keyset paginated on (state, city, id), see pagination.py
+  page = paginate_request(venue_areas_query(), VENUE_AREAS_ORDER)
+  data = group_venue_areas(page.items)
 
   ## DATA STRUCTURE ##
   """ data=[{
@@ -119,9 +302,10 @@ def venues():
       "num_upcoming_shows": 0,
     }]
   }] """
-  return render_template('pages/venues.html', areas=data)
+  return render_template('pages/venues.html', areas=data, page=page)
 
-@app.route('/venues/search', methods=['POST'])
+@bp.route('/venues/search', methods=['POST'])
+@replicas.read_only
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
@@ -130,35 +314,12 @@ def search_venues():
   
   # Storing the search text into search_term
   search_term=request.form.get('search_term', '').strip()
-  # Querying for the venues
-  venues = Venue.query.filter(Venue.name.ilike('%' + search_term.lower() + '%')).all()
-
-  # Initializations
-  data = []
-
-  for venue in venues:
-
-    # Getting the shows of the `venue`
-    shows = venue.shows
-    num_upcoming_shows = 0
+  # Querying for the venues, ranked by similarity to `search_term` when SEARCH_MODE is 'trigram'
+  # (or matched in memory when SEARCH_INDEX_ENABLED)
+  venues = find_by_name(Venue, search_indexes.venues, search_term)
 
-    # Looping over shows to find the number of upcoming shows
-    for show in shows:
-      if datetime.today() <= show.start_time:
-        num_upcoming_shows+=1
-
-    # Add to `data` dictionary
-    data.append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": num_upcoming_shows
-    })
-
-  # Data to be sent
-  response={
-    "count": len(venues),
-    "data": data
-  }
+  # Data to be sent: the number of upcoming shows is kept on each `venue` row (see payloads.py, rollups.py)
+  response = search_results_payload(venues)
 
   ## DATA STRUCTURE ##
   """ response={
@@ -171,66 +332,24 @@ def search_venues():
   }"""
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/venues/<int:venue_id>')
+@bp.route('/venues/<int:venue_id>')
+@replicas.read_only
+@conditional_requests.conditional(venue_validator)
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
   # DONE
 
-  # Querying for the venue with `venue_id`
-  venue = Venue.query.get(venue_id)
-  # Storing the shows of the venue with `venue_id`
-  shows = venue.shows # returns list [] of Show objects
-
-  # initializations
-  genres = []
-  past_shows = []
-  upcoming_shows = []
-  past_shows_count = 0
-  upcoming_shows_count = 0
-
-  # Iterating shows[] list to separate the upcoming and past shows
-  for show in shows:
-    if datetime.today() >= show.start_time:
-      past_shows_count+=1
-      past_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": show.artists.name,
-        "artist_image_link": show.artists.image_link,
-        "start_time": format_datetime(str(show.start_time))
-      })
-    else:
-      upcoming_shows_count+=1
-      upcoming_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": show.artists.name,
-        "artist_image_link": show.artists.image_link,
-        "start_time": format_datetime(str(show.start_time))
-      })
-
-  # Iterating the genres list to get the name of the genre
-  for genre in venue.genres:
-    genres.append(genre.name)
-  
-  # Data to be sent
-  data={
-    "id": venue.id,
-    "name": venue.name,
-    "genres": genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": past_shows_count,
-    "upcoming_shows_count": upcoming_shows_count,
-  }
+  # Querying for the venue with `venue_id` and its genres, then its numbers of upcoming and past shows
+  # (see rollups.py) and the first DETAIL_PAGE_SHOWS of each. See `split_shows()` in queries.py
+  venue = get_venue(venue_id)
+  if not venue:
+    abort(404)
+  shows = split_shows(venue_shows_query(venue_id), venue, Show.venue_id, current_app.config['DETAIL_PAGE_SHOWS'])
+
+  # Data to be sent: the venue with its shows split into past and upcoming (see payloads.py)
+  data = venue_detail_payload(venue, *shows, format='full')
 
   ## DATA STRUCTURE ##
   """ data1={
@@ -313,15 +432,28 @@ def show_venue(venue_id):
   #data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0] """
   return render_template('pages/show_venue.html', venue=data)
 
+@bp.route('/venues/<int:venue_id>/shows/<any(upcoming, past):when>')
+@replicas.read_only
+@conditional_requests.conditional(venue_validator)
+@page_cache.cached('venue:{venue_id}')
+def venue_shows(venue_id, when):
+  # The next DETAIL_PAGE_SHOWS upcoming or past shows of the venue page, after ?after=<cursor>
+  venue = Venue.query.get_or_404(venue_id)
+  shows, next_cursor = shows_page_payload(detail_shows_page(venue_shows_query(venue_id), when), venue_show_payload,
+    'full')
+  next_url = url_for('main.venue_shows', venue_id=venue_id, when=when, after=next_cursor) if next_cursor else None
+  return render_more_shows('pages/venue_show_tiles.html', '%s shows at %s' % (when.capitalize(), venue.name),
+    shows, next_url)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead. DONE
   # TODO: modify data to be the data object returned from db insertion DONE
@@ -351,20 +483,13 @@ def create_venue_submission():
       venue = Venue(name=name, city=city, state=state, address=address, phone=phone,image_link=image_link,
       facebook_link=facebook_link, website=website, seeking_talent=seeking_talent, seeking_description=seeking_description)
 
-      # Create a Genre object to insert into DB
-      for genre in genres:
-        genre_in_db = Genre.query.filter_by(name=genre).one_or_none()
-
-        # Add `genre` into db only if it's not in Genre table
-        if genre_in_db:
-          venue.genres.append(genre_in_db)
-        else:
-          new_genre = Genre(name=genre)
-          db.session.add(new_genre)
-          venue.genres.append(new_genre)
-        
+      # Resolve all the selected genres at once, inserting the ones not in Genre table (see genres.py)
+      venue.genres = genre_cache.resolve(genres)
+
       db.session.add(venue)
       db.session.commit()
+      search_indexes.add_venue(venue.id, name)
+      page_cache.invalidate('venues')
       print('Successful added the venue - ', name)
     except Exception as e:
       error_occured = True
@@ -385,7 +510,7 @@ def create_venue_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -396,22 +521,22 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@replicas.read_only
+@conditional_requests.conditional(artists_validator)
+@page_cache.cached('artists')
 def artists():
   # TODO: replace with real data returned from querying the database DONE
 
-  # Querying all the artists
-  artists = Artist.query.all()
+  # Querying one page of artists, keyset paginated on (name, id). See pagination.py
+  page = paginate_request(artists_query(), ARTISTS_ORDER)
 
   # Initializations
   data = []
 
   # Looping over `artists` to store the required data, which has to be sent
-  for artist in artists:
-    data.append({
-      "id": artist.id,
-      "name": artist.name
-    })
+  for artist in page.items:
+    data.append(artist_listing_payload(artist))
 
   ## DATA STRUCTURE ##
   """ data=[{
@@ -424,9 +549,10 @@ def artists():
     "id": 6,
     "name": "The Wild Sax Band",
   }] """
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, page=page)
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['POST'])
+@replicas.read_only
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
@@ -436,35 +562,12 @@ def search_artists():
   # Storing the search text into search_term
   search_term=request.form.get('search_term', '').strip()
 
-  # Querying for the artists
-  artists = Artist.query.filter(Artist.name.ilike('%' + search_term.lower() + '%')).all()
+  # Querying for the artists, ranked by similarity to `search_term` when SEARCH_MODE is 'trigram'
+  # (or matched in memory when SEARCH_INDEX_ENABLED)
+  artists = find_by_name(Artist, search_indexes.artists, search_term)
 
-  # Initializations
-  data = []
-
-  for artist in artists:
-
-    # Getting the shows of the `artist`
-    shows = artist.shows
-    num_upcoming_shows = 0
-
-    # Looping over shows to find the number of upcoming shows
-    for show in shows:
-      if datetime.today() <= show.start_time:
-        num_upcoming_shows+=1
-    
-    # Add to `data` dictionary
-    data.append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": num_upcoming_shows
-    })
-
-  # Data to be sent
-  response={
-    "count": len(artists),
-    "data": data
-  }
+  # Data to be sent: the number of upcoming shows is kept on each `artist` row (see payloads.py, rollups.py)
+  response = search_results_payload(artists)
 
   ## DATA STRUCTURE ##
   """ response={
@@ -477,65 +580,24 @@ def search_artists():
   } """
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
+@replicas.read_only
+@conditional_requests.conditional(artist_validator)
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
   # DONE
 
-  # Querying for the artist with `artist_id`
-  artist = Artist.query.get(artist_id)
-  # Storing the shows of the artist with `artist_id`
-  shows = artist.shows # returns list [] of Show objects
-
-  # initializations
-  genres = []
-  past_shows = []
-  upcoming_shows = []
-  past_shows_count = 0
-  upcoming_shows_count = 0
-
-  # Iterating shows[] list to separate the upcoming and past shows
-  for show in shows:
-    if datetime.today() > show.start_time:
-      past_shows_count+=1
-      past_shows.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venues.name,
-        "venue_image_link": show.venues.image_link,
-        "start_time": format_datetime(str(show.start_time))
-      })
-    else:
-      upcoming_shows_count+=1
-      upcoming_shows.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venues.name,
-        "venue_image_link": show.venues.image_link,
-        "start_time": format_datetime(str(show.start_time))
-      })
-
-  # Iterating the genres list to get the name of the genre
-  for genre in artist.genres:
-    genres.append(genre.name)
-  
-  # Data to be sent
-  data={
-    "id": artist.id,
-    "name": artist.name,
-    "genres": genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": past_shows_count,
-    "upcoming_shows_count": upcoming_shows_count,
-  }
+  # Querying for the artist with `artist_id` and its genres, then its numbers of upcoming and past shows
+  # (see rollups.py) and the first DETAIL_PAGE_SHOWS of each. See `split_shows()` in queries.py
+  artist = get_artist(artist_id)
+  if not artist:
+    abort(404)
+  shows = split_shows(artist_shows_query(artist_id), artist, Show.artist_id, current_app.config['DETAIL_PAGE_SHOWS'])
+
+  # Data to be sent: the artist with its shows split into past and upcoming (see payloads.py)
+  data = artist_detail_payload(artist, *shows, format='full')
 
   ## DATA STRUCTURE ##
   """ data1={
@@ -612,9 +674,22 @@ def show_artist(artist_id):
   #data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
   return render_template('pages/show_artist.html', artist=data)
 
+@bp.route('/artists/<int:artist_id>/shows/<any(upcoming, past):when>')
+@replicas.read_only
+@conditional_requests.conditional(artist_validator)
+@page_cache.cached('artist:{artist_id}')
+def artist_shows(artist_id, when):
+  # The next DETAIL_PAGE_SHOWS upcoming or past shows of the artist page, after ?after=<cursor>
+  artist = Artist.query.get_or_404(artist_id)
+  shows, next_cursor = shows_page_payload(detail_shows_page(artist_shows_query(artist_id), when), artist_show_payload,
+    'full')
+  next_url = url_for('main.artist_shows', artist_id=artist_id, when=when, after=next_cursor) if next_cursor else None
+  return render_more_shows('pages/artist_show_tiles.html', '%s shows of %s' % (when.capitalize(), artist.name),
+    shows, next_url)
+
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
 
@@ -623,7 +698,7 @@ def edit_artist(artist_id):
 
   if not artist:
     # If any other artist_id is entered it will be redirected to /artists endpoint
-    return redirect(url_for('artists'))
+    return redirect(url_for('main.artists'))
   else:
 
     # initializations
@@ -665,7 +740,7 @@ def edit_artist(artist_id):
   # TODO: populate form with fields from artist with ID <artist_id> DONE
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes DONE
@@ -704,22 +779,16 @@ def edit_artist_submission(artist_id):
       artist.seeking_venue = seeking_venue
       artist.seeking_description = seeking_description
       
-      # Emptying `artist.genres` so that new set of genres can be updated
-      artist.genres = []
-
-      # Create a Genre object to insert into DB
-      for genre in genres:
-        genre_in_db = Genre.query.filter_by(name=genre).one_or_none()
-        # Add `genre` into db only if it's not in Genre table
-        if genre_in_db:
-          artist.genres.append(genre_in_db)
-        else:
-          new_genre = Genre(name=genre)
-          db.session.add(new_genre)
-          artist.genres.append(new_genre)
-      
+      # Replacing `artist.genres` with the new set of genres, resolved all at once and
+      # inserting the ones not in Genre table (see genres.py)
+      artist.genres = genre_cache.resolve(genres)
+      # Set by hand: a change of the genres alone doesn't update the row (see exporter.py)
+      artist.updated_at = datetime.utcnow()
+
       # This updates the values
       db.session.commit()
+      search_indexes.add_artist(artist_id, name)
+      invalidate_artist_pages(artist_id)
     except Exception as e:
       error_occured = True
       print('Error occured while updating the artist - ', name, '\n', e)
@@ -734,9 +803,9 @@ def edit_artist_submission(artist_id):
   else:
     flash('Artist ' + request.form['name'] + ' was successfully updated!')
 
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('main.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
 
@@ -745,7 +814,7 @@ def edit_venue(venue_id):
 
   if not venue:
     # If any other venue_id is entered it will be redirected to /venues endpoint
-    return redirect(url_for('venues'))
+    return redirect(url_for('main.venues'))
   else:
 
     # initializations
@@ -806,7 +875,7 @@ def edit_venue(venue_id):
     # TODO: populate form with values from venue with ID <venue_id> DONE
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes DONE
@@ -847,22 +916,16 @@ def edit_venue_submission(venue_id):
       venue.seeking_talent = seeking_talent
       venue.seeking_description = seeking_description
       
-      # Emptying `venue.genres` so that new set of genres can be updated
-      venue.genres = []
-
-      # Create a Genre object to insert into DB
-      for genre in genres:
-        genre_in_db = Genre.query.filter_by(name=genre).one_or_none()
-        # Add `genre` into db only if it's not in Genre table
-        if genre_in_db:
-          venue.genres.append(genre_in_db)
-        else:
-          new_genre = Genre(name=genre)
-          db.session.add(new_genre)
-          venue.genres.append(new_genre)
-      
+      # Replacing `venue.genres` with the new set of genres, resolved all at once and
+      # inserting the ones not in Genre table (see genres.py)
+      venue.genres = genre_cache.resolve(genres)
+      # Set by hand: a change of the genres alone doesn't update the row (see exporter.py)
+      venue.updated_at = datetime.utcnow()
+
       # This updates the values
       db.session.commit()
+      search_indexes.add_venue(venue_id, name)
+      invalidate_venue_pages(venue_id)
     except Exception as e:
       error_occured = True
       print('Error occured while updating the venue - ', name, '\n', e)
@@ -877,17 +940,17 @@ def edit_venue_submission(venue_id):
   else:
     flash('Venue ' + request.form['name'] + ' was successfully updated!')
     
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Venue record in the db, instead. DONE
@@ -916,20 +979,13 @@ def create_artist_submission():
       artist =  Artist(name=name, city=city, state=state, phone=phone,image_link=image_link,
       facebook_link=facebook_link, website=website, seeking_venue=seeking_venue, seeking_description=seeking_description)
 
-      # Create a Genre object to insert into DB
-      for genre in genres:
-        genre_in_db = Genre.query.filter_by(name=genre).one_or_none()
-        
-        # Add `genre` into db only if it's not in Genre table
-        if genre_in_db:
-          artist.genres.append(genre_in_db)
-        else:
-          new_genre = Genre(name=genre)
-          db.session.add(new_genre)
-          artist.genres.append(new_genre)
+      # Resolve all the selected genres at once, inserting the ones not in Genre table (see genres.py)
+      artist.genres = genre_cache.resolve(genres)
 
       db.session.add(artist)
       db.session.commit()
+      search_indexes.add_artist(artist.id, name)
+      page_cache.invalidate('artists')
       print('Successful added the artist - ', name)
     except Exception as e:
       error_occured=True
@@ -947,42 +1003,34 @@ def create_artist_submission():
     # on successful db insert, flash success
     flash('Artist ' + artistForm.name.data + ' was successfully listed!')
   
-  return redirect(url_for('index'))
+  return redirect(url_for('main.index'))
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
+@replicas.read_only
+@conditional_requests.conditional(shows_validator)
+@page_cache.cached('shows')
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
   # DONE
 
-  # .desc() is called to show the most recent show first in /shows.
-  shows = Show.query.order_by(Show.start_time.desc()).all()
+  # Querying one page of shows, most recent show first, keyset paginated on (start_time, id).
+  # The venue and artist details are joined in the same query. See `shows_query()` in queries.py
+  page = paginate_request(shows_query(), SHOWS_ORDER, descending=True)
 
   # Initializations
   data = []
 
-  for show in shows:
-    
-    # Getting the venue details using backref of Venue
-    venue = show.venues
-    # Getting the artist details using backref of Artist
-    artist = show.artists
-
-    start_time = format_datetime(str(show.start_time))
-
-    data.append({
-      "venue_id": show.venue_id,
-      "venue_name": venue.name,
-      "artist_id": show.artist_id,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": start_time
-    })
+  # Formatting the start times of the whole page at once, as the page shows them
+  start_times = format_datetimes([show.start_time for show in page.items], 'full')
+
+  for show, start_time in zip(page.items, start_times):
+    data.append(show_listing_payload(show, start_time))
 
   ## DATA STRUCTURE ##
   """ data=[{
@@ -1021,15 +1069,18 @@ def shows():
     "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
     "start_time": "2035-04-15T20:00:00.000Z"
   }] """
-  return render_template('pages/shows.html', shows=data)
+  # Each show's row is cached until the show, its venue or its artist changes (see template_cache.py).
+  # In the order of `data`, which has no show ids
+  versions = [(show.id, show.updated_at, show.venue_updated_at, show.artist_updated_at) for show in page.items]
+  return render_template('pages/shows.html', shows=data, page=page, versions=versions)
 
-@app.route('/shows/create')
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
@@ -1051,7 +1102,10 @@ def create_show_submission():
       # Create a Show object to insert into DB
       show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
       db.session.add(show)
+      # Counting the show for its venue and artist in the same transaction (see rollups.py)
+      count_new_shows([(int(venue_id), int(artist_id), start_time)])
       db.session.commit()
+      invalidate_show_pages(int(venue_id), int(artist_id))
       print('Successfully added the Show at ', start_time)
     except Exception as e:
       error_occured = True
@@ -1061,7 +1115,7 @@ def create_show_submission():
       db.session.close()
   else:
     flash('Please try again! Enter a valid input.')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
   if error_occured:
     # TODO: on unsuccessful db insert, flash an error instead. DONE
@@ -1071,46 +1125,35 @@ def create_show_submission():
     flash('Show was successfully listed!')
 
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return redirect(url_for('index'))
+  return redirect(url_for('main.index'))
 
-@app.route('/shows/search', methods=['POST'])
+@bp.route('/shows/search', methods=['GET', 'POST'])
+@replicas.read_only
 def search_shows():
 
-  # Storing the search text into search_term
-  search_term=request.form.get('search_term', '').strip()
-
-  # Querying for the venues
-  venues = Venue.query.filter(Venue.name.ilike('%' + search_term.lower() + '%')).all()
-  
-  # Initializations
-  response = []
-
-  # Iterate over venues to find the shows
-  for venue in venues:
-    
-    # Getting the shows of the `venue`
-    shows = venue.shows
-
-    # Looping over `shows` to get the details of the venue and artist of the particular `show`
-    for show in shows:
+  # Storing the search text into search_term. The search form posts the first page,
+  # the pager links carry the term (and ?upcoming=1) to the next ones
+  search_term = request.values.get('search_term', '').strip()
+  upcoming = bool(request.values.get('upcoming'))
+  now = datetime.now()
+
+  # Venue and artist names are matched in memory when SEARCH_INDEX_ENABLED
+  venue_ids, artist_ids = indexed_show_search_ids(search_term)
+
+  # Querying one page of the shows matching the venue name, artist name or genre, with their venue
+  # and artist, in a single query keyset paginated on (start_time, id). See `search_shows_query()` in queries.py
+  query = search_shows_query(search_term, venue_ids, artist_ids)
+  if upcoming:
+    # Upcoming shows only, soonest first
+    page = paginate_request(query.filter(Show.start_time > now), SHOWS_ORDER)
+  else:
+    # Most recent first, like /shows
+    page = paginate_request(query, SHOWS_ORDER, descending=True)
 
-      # flag to have a track id the `show` is an upcoming show or not
-      is_upComingShow  = False
-      
-      if datetime.today() <= show.start_time:
-        # update `is_upComingShow` to True if the  `show` is an upcoming show
-        is_upComingShow = True
-      
-      # Adding the required data to update the Front-End
-      response.append({
-        "venue_id": show.venues.id,
-        "venue_name": show.venues.name,
-        "venue_image_link": show.venues.image_link,
-        "artist_id": show.artists.id,
-        "artist_name": show.artists.name,
-        "is_upComingShow": is_upComingShow,
-        "start_time": format_datetime(str(show.start_time))
-      })
+  # Formatting the start times of the whole page at once, as the page shows them, then adding the data
+  # the Front-End needs
+  start_times = format_datetimes([show.start_time for show in page.items], 'full')
+  response = [search_show_payload(show, now, start_time) for show, start_time in zip(page.items, start_times)]
 
   ## DATA STRUCTURE ##
   """ response = [{
@@ -1131,42 +1174,98 @@ def search_shows():
     "start_time": "2019-05-21T21:30:00.000Z"
   }] """
 
-  return render_template('pages/search_shows.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_shows.html', results=response, page=page, search_term=search_term, upcoming=upcoming)
+
+
+#  API
+#  ----------------------------------------------------------------
+#  The data of the listings and detail pages as JSON, in the same shapes the
+#  views render (see the `## DATA STRUCTURE ##` blocks above).
+#  The listings are streamed from a server-side cursor, as a JSON array or,
+#  with ?format=ndjson, one JSON object per line. See streaming.py
+
+@bp.route('/api/venues')
+@replicas.read_only
+@conditional_requests.conditional(venues_validator)
+def api_venues():
+  # Every area with its venues, like /venues
+  rows = stream_query(venue_areas_query().order_by(*VENUE_AREAS_ORDER))
+  return json_stream_response(iter_venue_areas(rows))
+
+@bp.route('/api/venues/<int:venue_id>')
+@replicas.read_only
+@conditional_requests.conditional(venue_validator)
+def api_venue(venue_id):
+  venue = get_venue(venue_id)
+  if not venue:
+    abort(404)
+  shows = split_shows(venue_shows_query(venue_id), venue, Show.venue_id, current_app.config['DETAIL_PAGE_SHOWS'])
+  return jsonify(venue_detail_payload(venue, *shows))
+
+@bp.route('/api/venues/<int:venue_id>/shows/<any(upcoming, past):when>')
+@replicas.read_only
+@conditional_requests.conditional(venue_validator)
+def api_venue_shows(venue_id, when):
+  # The next page of the venue's upcoming or past shows, after ?after=<upcoming_shows_next / past_shows_next>
+  shows, next_cursor = shows_page_payload(detail_shows_page(venue_shows_query(venue_id), when), venue_show_payload)
+  return jsonify({"shows": shows, "next": next_cursor})
+
+@bp.route('/api/artists')
+@replicas.read_only
+@conditional_requests.conditional(artists_validator)
+def api_artists():
+  rows = stream_query(artists_query().order_by(*ARTISTS_ORDER))
+  return json_stream_response(artist_listing_payload(artist) for artist in rows)
+
+@bp.route('/api/artists/<int:artist_id>')
+@replicas.read_only
+@conditional_requests.conditional(artist_validator)
+def api_artist(artist_id):
+  artist = get_artist(artist_id)
+  if not artist:
+    abort(404)
+  shows = split_shows(artist_shows_query(artist_id), artist, Show.artist_id, current_app.config['DETAIL_PAGE_SHOWS'])
+  return jsonify(artist_detail_payload(artist, *shows))
+
+@bp.route('/api/artists/<int:artist_id>/shows/<any(upcoming, past):when>')
+@replicas.read_only
+@conditional_requests.conditional(artist_validator)
+def api_artist_shows(artist_id, when):
+  shows, next_cursor = shows_page_payload(detail_shows_page(artist_shows_query(artist_id), when), artist_show_payload)
+  return jsonify({"shows": shows, "next": next_cursor})
+
+@bp.route('/api/shows')
+@replicas.read_only
+@conditional_requests.conditional(shows_validator)
+def api_shows():
+  # Every show, most recent first, like /shows
+  rows = stream_query(shows_query().order_by(*[column.desc() for column in SHOWS_ORDER]))
+  return json_stream_response(show_listing_payload(show) for show in rows)
 
 
 #  Error Handler
 #  ----------------------------------------------------------------
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,201 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, request_started
+from werkzeug.exceptions import HTTPException
+from app import create_app
+from async_db import async_db
+from async_views import async_views
+
+### ASGI Serving Mode
+# Serves the app from an ASGI server, with the read-heavy views (the venue and
+# artist pages and the searches, see async_views.py) running as coroutines on an
+# async database driver:
+#
+#   $ uvicorn --factory asgi:create_asgi_app --workers 4
+#
+# While those views wait on the database, the worker's event loop serves other
+# requests, instead of holding a whole sync worker per request.
+#
+# Every other view, including the create/edit submissions, is the WSGI app of
+# app.py, unchanged, run on a pool of ASGI_SYNC_THREADS threads per worker with
+# the sync session. The async views go through the same request hooks as the
+# sync ones (sessions, page cache, read replicas, metrics, profiler and error
+# handlers), see `AsyncReadsApp.dispatch()`.
+#
+# The async engines need a database file or server: the in-memory SQLite of the
+# 'memory' profile can't be shared with them (see async_db.py).
+
+
+def create_asgi_app(profile=None, **overrides):
+    # `create_app()` (app.py) served as ASGI, with the async views
+    app = create_app(profile, **overrides)
+    async_db.init_app(app)
+    return AsyncReadsApp(app)
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            raise ValueError('Unexpected ASGI message %r' % message['type'])
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def build_environ(scope, body):
+    # The WSGI environ of an ASGI http `scope` and its request body
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+    path_info = scope['path'].encode('utf-8').decode('latin-1')
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        # The whole body, read up front: Werkzeug can read it to the end without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    environ.setdefault('CONTENT_LENGTH', str(len(body)))
+    return environ
+
+
+def response_start(status, headers):
+    # The http.response.start message of a WSGI status line and headers
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    }
+
+
+def run_wsgi(app, environ, send):
+    # Runs the WSGI app in a pool thread, handing each chunk of the response to `send` as it is
+    # produced, so streamed responses (the /api listings) stay streamed
+    start = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and start and start[0] is None:
+            raise exc_info[1].with_traceback(exc_info[2])
+        start[:] = [response_start(status, headers)]
+
+    result = app(environ, start_response)
+    try:
+        for chunk in result:
+            if start[0] is not None:
+                send(start[0])
+                start[0] = None
+            if chunk:
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if start[0] is not None:
+            send(start[0])
+        send({'type': 'http.response.body'})
+    finally:
+        # Runs the response's close callbacks, e.g. the metrics of streamed responses
+        if hasattr(result, 'close'):
+            result.close()
+
+
+class AsyncReadsApp(object):
+    # ASGI application around the Flask `app`
+
+    def __init__(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(app.config.get('ASGI_SYNC_THREADS', 10), thread_name_prefix='fyyur-sync')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope %r' % scope['type'])
+
+        environ = build_environ(scope, await read_body(receive))
+        view = self.match_async_view(environ)
+        if view is None:
+            loop = asyncio.get_running_loop()
+
+            def send_from_thread(message):
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+            await loop.run_in_executor(self.executor, run_wsgi, self.app, environ, send_from_thread)
+        else:
+            await self.dispatch(view, environ, send)
+
+    def match_async_view(self, environ):
+        # The async view of the request's endpoint, if it has one
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ, server_name=self.app.config['SERVER_NAME']).match()
+        except HTTPException:
+            # Redirects, 404 and 405 are answered by the sync app
+            return None
+        return async_views.get(endpoint)
+
+    async def dispatch(self, view, environ, send):
+        # `Flask.wsgi_app()` and `full_dispatch_request()` around a coroutine view: the same
+        # request context, hooks and error handling, with the view awaited
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                try:
+                    request_started.send(app)
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**request.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+
+            app_iter, status, headers = response.get_wsgi_response(environ)
+            try:
+                await send(response_start(status, headers))
+                for chunk in app_iter:
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body'})
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+        finally:
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
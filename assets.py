@@ -0,0 +1,224 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+import brotli
+import rcssmin
+import rjsmin
+from flask import request, url_for, send_from_directory
+
+### Static Assets
+# The stylesheets and scripts of layouts/main.html are concatenated into a few
+# bundles, minified, and written to static/dist/ under names carrying a hash of
+# their content, e.g. dist/bundle.3f2a9c1b04de.css. The few files the templates
+# link on their own (the jQuery fallback, the splash image) are copied there the
+# same way, as are the files the stylesheets refer to with url().
+#
+# static/dist/manifest.json maps each bundle/file name to its hashed path, and
+# `asset_url(name)` in the templates looks it up:
+#   <link rel="stylesheet" href="{{ asset_url('bundle.css') }}">
+#
+# A hashed file never changes, so /static/dist/ is served with a year-long
+# `Cache-Control: immutable`: browsers load each version once and never revalidate
+# it, and a new version is a new URL. Text files are stored gzipped (.gz) and
+# brotli-compressed (.br) next to the plain one, and served in the encoding the
+# browser accepts, without compressing anything per request.
+#
+# `flask build-assets` builds static/dist/ (run it on deploy). The app builds it at
+# startup when the manifest is missing, and with ASSETS_REBUILD_STALE
+# (development) when a source file is newer than the manifest.
+
+# bundle name -> source files under static/, in load order
+BUNDLES = {
+    'bundle.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css', 'css/main.responsive.css',
+        'css/main.quickfix.css'],
+    # Loaded in <head>
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    # Deferred, after jQuery: bootstrap and plugins.js need it
+    'app.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+# Files linked on their own
+FILES = ['js/libs/jquery-1.11.1.min.js', 'js/libs/respond-1.4.2.min.js', 'img/front-splash.jpg']
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+PRECOMPRESSED = ('.css', '.js', '.svg', '.eot', '.ttf', '.otf')
+# (extension, Content-Encoding), in order of preference
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def hashed_name(path, data):
+    # css/main.css -> css/main.<hash>.css
+    root, ext = posixpath.splitext(path)
+    return '%s.%s%s' % (root, hashlib.sha1(data).hexdigest()[:12], ext)
+
+
+def minify(name, text):
+    if name.endswith('.css'):
+        return rcssmin.cssmin(text, keep_bang_comments=True)
+    return rjsmin.jsmin(text, keep_bang_comments=True)
+
+
+class AssetBuilder(object):
+    # Writes the hashed files of BUNDLES and FILES to <static>/dist/ and returns the manifest
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.dist = os.path.join(static_folder, DIST)
+        self.manifest = {}
+
+    def build(self):
+        for path in FILES:
+            self.add_file(path)
+        for name, sources in BUNDLES.items():
+            texts = [self.read_source(path) for path in sources]
+            if name.endswith('.js'):
+                # A script without a trailing semicolon mustn't run into the next one
+                text = ';\n'.join(minify(name, text) for text in texts)
+            else:
+                text = '\n'.join(minify(name, text) for text in texts)
+            self.write(name, text.encode('utf-8'))
+        return self.manifest
+
+    def read_source(self, path):
+        with open(os.path.join(self.static_folder, path), encoding='utf-8') as f:
+            text = f.read()
+        if path.endswith('.css'):
+            text = self.rewrite_urls(path, text)
+        return text
+
+    def rewrite_urls(self, path, text):
+        # url()s of a stylesheet, relative to its bundle in dist/: hashed copies of the files that exist,
+        # the original location otherwise
+        def replace(match):
+            url = match.group(2).strip()
+            if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+                return match.group(0)
+            target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+            if os.path.isfile(os.path.join(self.static_folder, target)):
+                target = self.add_file(target)
+            else:
+                target = posixpath.join('..', target)
+            return 'url("%s%s")' % (target, suffix)
+        return CSS_URL.sub(replace, text)
+
+    def add_file(self, path):
+        # Copies static/<path> to dist/ under its hashed name; returns that name
+        if path not in self.manifest:
+            with open(os.path.join(self.static_folder, path), 'rb') as f:
+                self.write(path, f.read())
+        return self.manifest[path][len(DIST) + 1:]
+
+    def write(self, name, data):
+        hashed = hashed_name(name, data)
+        path = os.path.join(self.dist, hashed)
+        if not os.path.exists(path):
+            write_file(path, data)
+            if name.endswith(PRECOMPRESSED):
+                for extension, compressed in ((('.gz', gzip.compress(data, 9, mtime=0)),
+                        ('.br', brotli.compress(data, quality=11)))):
+                    if len(compressed) < len(data):
+                        write_file(path + extension, compressed)
+        self.manifest[name] = posixpath.join(DIST, hashed)
+
+
+def write_file(path, data):
+    # Written to a temporary file and renamed, so workers building at once never read half a file
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+
+
+def source_files():
+    # The files under static/ that dist/ is built from
+    return sorted(set(sum(BUNDLES.values(), [])) | set(FILES))
+
+
+class Assets(object):
+
+    def __init__(self):
+        self.manifest = {}
+        self.static_folder = None
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.manifest = self.load()
+        if not self.manifest or (app.config.get('ASSETS_REBUILD_STALE') and self.is_stale()):
+            self.build()
+        app.add_template_global(self.asset_url, 'asset_url')
+        # The `static` endpoint, serving dist/ with the headers above
+        static_view = app.view_functions['static']
+        app.view_functions['static'] = lambda filename: self.send_static_file(static_view, filename)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.static_folder, DIST, MANIFEST)
+
+    def load(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def is_stale(self):
+        built = os.path.getmtime(self.manifest_path)
+        return any(os.path.getmtime(os.path.join(self.static_folder, path)) > built
+            for path in source_files())
+
+    def build(self):
+        # Builds dist/ and its manifest. The files of the previous build are kept, for the pages
+        # rendered before it; older ones are removed
+        previous = self.load()
+        manifest = AssetBuilder(self.static_folder).build()
+        write_file(self.manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+        keep = set(os.path.join(self.static_folder, path) for path in list(previous.values()) + list(manifest.values()))
+        keep.add(self.manifest_path)
+        for directory, _, files in os.walk(os.path.join(self.static_folder, DIST)):
+            for name in files:
+                path = os.path.join(directory, name)
+                original = path[:-3] if path.endswith(('.gz', '.br')) else path
+                if original not in keep:
+                    os.remove(path)
+        self.manifest = manifest
+        return manifest
+
+    def asset_url(self, name):
+        # URL of the bundle or static file `name`, e.g. asset_url('bundle.css')
+        return url_for('static', filename=self.manifest.get(name, name))
+
+    def send_static_file(self, static_view, filename):
+        if not filename.startswith(DIST + '/') or filename.endswith(MANIFEST):
+            return static_view(filename=filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        directory = os.path.join(self.static_folder, DIST)
+        name = filename[len(DIST) + 1:]
+        encoding = None
+        if filename.endswith(PRECOMPRESSED):
+            for extension, candidate in ENCODINGS:
+                if request.accept_encodings[candidate] and os.path.isfile(os.path.join(directory, name + extension)):
+                    name, encoding = name + extension, candidate
+                    break
+        response = send_from_directory(directory, name, mimetype=mimetype, max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if filename.endswith(PRECOMPRESSED):
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+
+assets = Assets()
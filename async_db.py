@@ -0,0 +1,75 @@
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from metrics import request_metrics
+from profiler import request_profiler
+from search import trigram_similarity
+
+### Async Database
+# The async engines and sessions of the ASGI serving mode (asgi.py), which the
+# read-heavy views of async_views.py query instead of `db.session`.
+#
+# There is one async engine per database of the app: the primary
+# (SQLALCHEMY_DATABASE_URI) and every bind of SQLALCHEMY_BINDS, with the same URL
+# on an async driver (asyncpg for PostgreSQL, aiosqlite for SQLite) and the
+# ASYNC_ENGINE_OPTIONS of config.py. `async_db.session()` opens a session on the
+# replica @replicas.read_only picked for the request, like `RoutingSession` does
+# for the sync views (see replicas.py), or on the primary.
+#
+# The statements are recorded by the request metrics and the profiler like those
+# of the sync engines.
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(database_uri):
+    # `database_uri` on the async driver of its database
+    url = make_url(database_uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError('No async driver for %r databases, expected one of: %s' % (backend, ', '.join(sorted(ASYNC_DRIVERS))))
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        # Each connection of an in-memory database is a database of its own
+        raise ValueError('The async engine cannot share an in-memory SQLite database, use a file')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def register_sqlite_similarity(dbapi_connection, connection_record):
+    # The similarity() function of search.py, on aiosqlite connections
+    dbapi_connection.create_function('similarity', 2, trigram_similarity)
+
+
+class AsyncDatabase(object):
+
+    def __init__(self):
+        self.engines = {}  # bind (None for the primary) -> AsyncEngine
+
+    def init_app(self, app):
+        options = app.config.get('ASYNC_ENGINE_OPTIONS') or {}
+        uris = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        uris[None] = app.config['SQLALCHEMY_DATABASE_URI']
+
+        for bind, uri in uris.items():
+            engine = create_async_engine(async_url(uri), **options)
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine.sync_engine, 'connect', register_sqlite_similarity)
+            request_metrics.instrument_engine(engine.sync_engine)
+            request_profiler.instrument_engine(engine.sync_engine)
+            self.engines[bind] = engine
+
+    def session(self):
+        # A new AsyncSession on the request's replica, or on the primary. Use it as
+        # `async with async_db.session() as session:`, which closes it
+        bind = g.get('replica_bind') if has_request_context() else None
+        return AsyncSession(self.engines[bind], expire_on_commit=False)
+
+    async def dispose(self):
+        for engine in self.engines.values():
+            await engine.dispose()
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime
+from flask import current_app, request, render_template, abort
+from sqlalchemy.orm import selectinload
+from async_db import async_db
+from conditional import conditional_requests, venue_validator, artist_validator
+from formatting import format_datetimes
+from models import *
+from page_cache import page_cache
+from pagination import keyset_query, keyset_page, page_request_args
+from payloads import *
+from queries import venue_shows_query, artist_shows_query, when_shows, search_shows_query, SHOWS_ORDER
+from replicas import replicas
+from rollups import started_shows, show_counts
+from search import name_search_query, rank_by_ids, indexed_show_search_ids
+from search_index import search_indexes
+
+### Async Read Views
+# The venue and artist pages and the searches as coroutines, for the ASGI serving
+# mode (asgi.py): while one of them waits on the database, the worker serves
+# other requests.
+#
+# Each one replaces the view of app.py with the same endpoint, and renders the same
+# template with the same payload (payloads.py). The statements are built by the
+# same helpers (queries.py, search.py, rollups.py, pagination.py) and run on an
+# AsyncSession (async_db.py) instead of `db.session`; the page cache, the read
+# replicas and the conditional requests apply as they do to the sync views.
+#
+# Only reads are here: every other view, including the create/edit submissions,
+# runs as before on the sync session.
+
+# endpoint -> coroutine
+async_views = {}
+
+
+def async_view(endpoint):
+    # Registers the coroutine as the view of `endpoint` (of the `main` blueprint) in the ASGI mode
+    def decorator(view):
+        async_views['main.' + endpoint] = view
+        return view
+    return decorator
+
+
+async def fetch_all(session, query):
+    # The rows of a Query of the sync helpers, read through `session`
+    return (await session.execute(query.statement)).all()
+
+
+async def paginate(session, query, columns, after=None, before=None, per_page=50, descending=False):
+    # `keyset_paginate()` (pagination.py) on `session`. Raises ValueError for an invalid cursor
+    rows = await fetch_all(session, keyset_query(query, columns, after, before, per_page, descending))
+    return keyset_page(rows, columns, after, before, per_page)
+
+
+async def split_shows(session, query, owner, column):
+    # `split_shows()` of queries.py: the show counts of a venue/artist and the first page of its
+    # upcoming and past shows
+    now = datetime.now()
+    per_page = current_app.config['DETAIL_PAGE_SHOWS']
+    started = (await session.execute(started_shows(column, owner.id, now).statement)).scalar()
+    pages = []
+    for when in ('upcoming', 'past'):
+        shows, descending = when_shows(query, when, now)
+        pages.append(await paginate(session, shows, SHOWS_ORDER, per_page=per_page, descending=descending))
+    return (show_counts(owner, column, now, started),) + tuple(pages)
+
+
+async def ensure_search_indexes():
+    # `search_indexes.ensure_built()` in a thread: the build scans the tables, and a refresh
+    # queries them, which would block the event loop. The thread gets the request's context
+    await asyncio.to_thread(search_indexes.ensure_built)
+
+
+async def find_by_name(session, model, index, search_term):
+    # `find_by_name()` of search.py on `session`
+    await ensure_search_indexes()
+    query, ids = name_search_query(model, index, search_term)
+    if query is None:
+        return []
+    rows = (await session.execute(query.statement)).scalars().all()
+    return rank_by_ids(rows, ids)
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@async_view('search_venues')
+@replicas.read_only
+async def search_venues():
+    search_term = request.form.get('search_term', '').strip()
+    async with async_db.session() as session:
+        venues = await find_by_name(session, Venue, search_indexes.venues, search_term)
+    return render_template('pages/search_venues.html', results=search_results_payload(venues),
+        search_term=request.form.get('search_term', ''))
+
+
+@async_view('show_venue')
+@replicas.read_only
+@conditional_requests.conditional(venue_validator)
+@page_cache.cached('venue:{venue_id}')
+async def show_venue(venue_id):
+    async with async_db.session() as session:
+        venue = await session.get(Venue, venue_id, options=[selectinload(Venue.genres)])
+        if not venue:
+            abort(404)
+        shows = await split_shows(session, venue_shows_query(venue_id), venue, Show.venue_id)
+    return render_template('pages/show_venue.html', venue=venue_detail_payload(venue, *shows, format='full'))
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@async_view('search_artists')
+@replicas.read_only
+async def search_artists():
+    search_term = request.form.get('search_term', '').strip()
+    async with async_db.session() as session:
+        artists = await find_by_name(session, Artist, search_indexes.artists, search_term)
+    return render_template('pages/search_artists.html', results=search_results_payload(artists),
+        search_term=request.form.get('search_term', ''))
+
+
+@async_view('show_artist')
+@replicas.read_only
+@conditional_requests.conditional(artist_validator)
+@page_cache.cached('artist:{artist_id}')
+async def show_artist(artist_id):
+    async with async_db.session() as session:
+        artist = await session.get(Artist, artist_id, options=[selectinload(Artist.genres)])
+        if not artist:
+            abort(404)
+        shows = await split_shows(session, artist_shows_query(artist_id), artist, Show.artist_id)
+    return render_template('pages/show_artist.html', artist=artist_detail_payload(artist, *shows, format='full'))
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@async_view('search_shows')
+@replicas.read_only
+async def search_shows():
+    search_term = request.values.get('search_term', '').strip()
+    upcoming = bool(request.values.get('upcoming'))
+    now = datetime.now()
+
+    await ensure_search_indexes()
+    query = search_shows_query(search_term, *indexed_show_search_ids(search_term))
+    if upcoming:
+        query = query.filter(Show.start_time > now)
+    async with async_db.session() as session:
+        try:
+            page = await paginate(session, query, SHOWS_ORDER, descending=not upcoming, **page_request_args())
+        except ValueError:
+            abort(400)
+
+    start_times = format_datetimes([show.start_time for show in page.items], 'full')
+    response = [search_show_payload(show, now, start_time) for show, start_time in zip(page.items, start_times)]
+    return render_template('pages/search_shows.html', results=response, page=page, search_term=search_term,
+        upcoming=upcoming)
@@ -0,0 +1,53 @@
+"""Micro-benchmark of show start time formatting.
+
+Compares the original `format_datetime(str(show.start_time))` (str -> dateutil
+parse -> babel.dates.format_datetime on every call) with formatting.py.
+
+    python bench/bench_datetime.py [number of shows]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from formatting import format_datetime, format_datetimes
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    # A page of shows: evening start times, a few shows sharing each one
+    start = datetime(2035, 4, 1, 20, 0)
+    start_times = [start + timedelta(days=i // 3, minutes=30 * (i % 3)) for i in range(count)]
+    strings = [str(value) for value in start_times]
+
+    # Same output as before
+    assert [legacy_format_datetime(value) for value in strings] == format_datetimes(start_times)
+    assert legacy_format_datetime(strings[0], 'full') == format_datetime(start_times[0], 'full')
+
+    cases = [
+        ('legacy  format_datetime(str(dt))', lambda: [legacy_format_datetime(value) for value in strings]),
+        ('new     format_datetime(str)', lambda: [format_datetime(value) for value in strings]),
+        ('new     format_datetime(dt)', lambda: [format_datetime(value) for value in start_times]),
+        ('new     format_datetimes([dt])', lambda: format_datetimes(start_times)),
+    ]
+    print('Formatting %d start times (best of 5):' % count)
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, number=1, repeat=5))
+        print('  %-36s %8.2f ms  %6.2f us/show' % (name, seconds * 1000, seconds * 1e6 / count))
+
+
+if __name__ == '__main__':
+    main()
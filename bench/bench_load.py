@@ -0,0 +1,272 @@
+"""Load comparison of the sync (WSGI) and async (ASGI) serving modes.
+
+Fills a database with deterministic synthetic data (datagen.py), then serves
+the app with the same number of worker processes in each mode:
+
+    sync   gunicorn --workers N (sync workers, one request at a time each)
+    async  uvicorn --workers N --factory asgi:create_asgi_app (see asgi.py)
+
+and drives both with the same concurrent clients for --duration seconds, over
+the read-heavy routes the async mode serves from async views: the venue and
+artist pages and the three searches. Reports requests/sec, p50 and p99 latency
+of each mode.
+
+    python bench/bench_load.py --workers 4 --concurrency 64
+    python bench/bench_load.py --database postgresql://localhost/fyyur_bench --generate --shows 1000000
+
+Without --database the data goes to a temporary SQLite file. The async mode
+pays off when the workers wait on a database server: benchmark PostgreSQL
+(asyncpg) for numbers that mean something. The clients open a connection per
+request (gunicorn's sync workers close it after each response), and run in this
+process, so keep an eye on its CPU at high request rates.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import warnings
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH, '..')
+sys.path.insert(0, BENCH)
+from bench_routes import create_app, percentile
+
+# (name, method, path, form data). {id} is a venue/artist id, {term} a search term
+ROUTES = [
+    ('show_venue', 'GET', '/venues/{id}', None),
+    ('show_artist', 'GET', '/artists/{id}', None),
+    ('search_venues', 'POST', '/venues/search', {'search_term': '{term}'}),
+    ('search_artists', 'POST', '/artists/search', {'search_term': '{term}'}),
+    ('search_shows', 'GET', '/shows/search?search_term={term}', None),
+]
+TERMS = ['blue', 'lounge', 'band', 'jazz', 'club', 'the']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', help='SQLAlchemy URL of the database (default: a temporary SQLite file)')
+    parser.add_argument('--generate', action='store_true', help='fill --database with synthetic data first (it must be empty)')
+    parser.add_argument('--modes', default='sync,async', help='comma separated modes to run')
+    parser.add_argument('--workers', type=int, default=2, help='worker processes of both modes')
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=15, help='seconds of load per mode')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of untimed load per mode')
+    parser.add_argument('--ids', type=int, default=200, help='venue/artist pages are requested for ids 1..IDS')
+    parser.add_argument('--search-mode', choices=['trigram', 'substring'], default='trigram',
+        help='SEARCH_MODE of the servers; trigram needs pg_trgm on PostgreSQL')
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+    args.page_cache = False
+    return args
+
+
+### Servers
+# The server processes import this module and build the app with the functions below,
+# configured by the environment `server_environ()` sets.
+
+def overrides():
+    # Every request runs its view, and statements slowed down by the load are not logged
+    return {'PAGE_CACHE_BACKEND': None, 'SLOW_QUERY_THRESHOLD_MS': 60000,
+        'SEARCH_MODE': os.environ.get('FYYUR_BENCH_SEARCH_MODE', 'trigram')}
+
+
+def wsgi_app():
+    from app import create_app
+    return create_app('production', **overrides())
+
+
+def asgi_app():
+    from asgi import create_asgi_app
+    return create_asgi_app('production', **overrides())
+
+
+def server_environ(database, search_mode):
+    environ = dict(os.environ)
+    environ.update({
+        'DATABASE_URL': database,
+        'FYYUR_BENCH_SEARCH_MODE': search_mode,
+        'SECRET_KEY': 'bench',
+        'PYTHONPATH': os.pathsep.join([ROOT, BENCH, environ.get('PYTHONPATH', '')]),
+        'PYTHONWARNINGS': 'ignore',
+    })
+    return environ
+
+
+def server_command(mode, workers, port):
+    bind = '127.0.0.1:%d' % port
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--worker-class', 'sync',
+            '--bind', bind, '--log-level', 'warning', 'bench_load:wsgi_app()']
+    return [sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port),
+        '--log-level', 'warning', '--no-access-log', '--factory', 'bench_load:asgi_app']
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The server exited with %d' % process.returncode)
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('The server did not listen on port %d within %ds' % (port, timeout))
+
+
+### Clients
+
+def make_requests(args, count):
+    # `count` (name, raw HTTP request) pairs over ROUTES, with random ids and search terms
+    rng = random.Random(args.seed)
+    requests = []
+    for _ in range(count):
+        name, method, path, form = rng.choice(ROUTES)
+        values = {'id': rng.randint(1, args.ids), 'term': rng.choice(TERMS)}
+        path = path.format(**values)
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: 127.0.0.1', 'Connection: close']
+        body = b''
+        if form is not None:
+            body = urllib.parse.urlencode(dict((key, value.format(**values)) for key, value in form.items())).encode()
+            lines += ['Content-Type: application/x-www-form-urlencoded', 'Content-Length: %d' % len(body)]
+        requests.append((name, ('\r\n'.join(lines) + '\r\n\r\n').encode('ascii') + body))
+    return requests
+
+
+async def fetch(port, request):
+    # (status, seconds) of one request, on its own connection
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    status = int(response.split(b' ', 2)[1]) if response.startswith(b'HTTP/') else 0
+    return status, time.perf_counter() - started
+
+
+async def load(port, requests, concurrency, duration):
+    # Runs `concurrency` clients for `duration` seconds; returns [(route, status, seconds)]
+    results = []
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        index = offset
+        while time.perf_counter() < deadline:
+            name, request = requests[index % len(requests)]
+            index += concurrency
+            try:
+                status, elapsed = await fetch(port, request)
+            except OSError:
+                status, elapsed = 0, 0.0
+            results.append((name, status, elapsed))
+
+    await asyncio.gather(*[client(offset) for offset in range(concurrency)])
+    return results
+
+
+def summarize(results, duration):
+    ok = [elapsed for _, status, elapsed in results if status == 200]
+    summary = {
+        'requests': len(results),
+        'errors': len(results) - len(ok),
+        'requests_per_second': len(ok) / duration,
+        'p50_ms': percentile(ok, 0.50) * 1000 if ok else None,
+        'p99_ms': percentile(ok, 0.99) * 1000 if ok else None,
+        'routes': {},
+    }
+    for name in sorted(set(name for name, _, _ in results)):
+        timings = [elapsed for route, status, elapsed in results if route == name and status == 200]
+        if timings:
+            summary['routes'][name] = {'p50_ms': percentile(timings, 0.50) * 1000, 'p99_ms': percentile(timings, 0.99) * 1000}
+    return summary
+
+
+def run_mode(mode, args, database, requests):
+    process = subprocess.Popen(server_command(mode, args.workers, args.port), env=server_environ(database, args.search_mode),
+        cwd=tempfile.gettempdir())
+    try:
+        wait_for_port(args.port, process)
+        asyncio.run(load(args.port, requests, args.concurrency, args.warmup))
+        results = asyncio.run(load(args.port, requests, args.concurrency, args.duration))
+    finally:
+        process.terminate()
+        process.wait()
+    return summarize(results, args.duration)
+
+
+def main():
+    args = parse_args()
+    directory = None
+    database = args.database
+    if database is None:
+        directory = tempfile.mkdtemp(prefix='fyyur-load-')
+        database = 'sqlite:///' + os.path.join(directory, 'fyyur.db')
+        args.generate = True
+
+    try:
+        if args.generate:
+            args.database = database
+            app, db = create_app(args)
+            warnings.simplefilter('ignore')
+            from datagen import generate
+
+            with app.app_context():
+                if db.engine.dialect.name == 'postgresql' and args.search_mode == 'trigram':
+                    # The name searches rank by similarity(), which the migrations install with pg_trgm
+                    with db.engine.begin() as connection:
+                        connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                db.create_all()
+                started = time.perf_counter()
+                counts = generate(db, venues=args.venues, artists=args.artists, genres=args.genres,
+                    shows=args.shows, seed=args.seed)
+                print('Generated %s in %.1fs' % (counts, time.perf_counter() - started))
+                db.session.remove()
+                db.engine.dispose()
+
+        requests = make_requests(args, 10000)
+        results = {}
+        for mode in args.modes.split(','):
+            print('\n%s: %d workers, %d clients, %.0fs...' % (mode, args.workers, args.concurrency, args.duration))
+            results[mode] = run_mode(mode, args, database, requests)
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    header = '\n%-6s %8s %8s %8s %10s %10s %10s' % ('mode', 'workers', 'clients', 'errors', 'req/s', 'p50 ms', 'p99 ms')
+    print(header)
+    print('-' * (len(header) - 1))
+    for mode, summary in results.items():
+        print('%-6s %8d %8d %8d %10.1f %10.2f %10.2f' % (mode, args.workers, args.concurrency, summary['errors'],
+            summary['requests_per_second'], summary['p50_ms'] or 0, summary['p99_ms'] or 0))
+
+    routes = sorted(set(name for summary in results.values() for name in summary['routes']))
+    print('\n%-16s' % 'p99 ms' + ''.join('%12s' % mode for mode in results))
+    for name in routes:
+        print('%-16s' % name + ''.join('%12.2f' % summary['routes'].get(name, {}).get('p99_ms', 0)
+            for summary in results.values()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'workers': args.workers, 'concurrency': args.concurrency, 'duration': args.duration,
+                'database': database.split(':', 1)[0], 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
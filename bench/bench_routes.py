@@ -0,0 +1,255 @@
+"""Route-level benchmark of every route in app.py.
+
+Fills an in-memory SQLite database (the 'memory' profile of config.py) with
+deterministic synthetic data (datagen.py), then drives each route through the
+Flask test client and reports, per route: latency percentiles, SQL queries per
+request and peak Python memory of one request. Results can be saved as JSON and compared with a run on another commit.
+The routes of QUERY_BUDGETS fail the run when a request runs more queries than their budget.
+
+    python bench/bench_routes.py --shows 20000 --output before.json
+    git checkout <other commit>
+    python bench/bench_routes.py --shows 20000 --compare before.json
+
+The page cache is disabled unless --page-cache is given, so every request
+runs the view.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+VENUE_FORM = {
+    'name': 'Benchmark Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Bench Street',
+    'phone': '512-000-0000', 'genres': ['Jazz', 'Blues'], 'facebook_link': 'https://www.facebook.com/bench',
+    'seeking_talent': 'y', 'seeking_description': 'Benchmarking',
+}
+ARTIST_FORM = {
+    'name': 'Benchmark Artist', 'city': 'Austin', 'state': 'TX', 'phone': '512-000-0000',
+    'genres': ['Jazz', 'Funk'], 'facebook_link': 'https://www.facebook.com/bench',
+}
+
+# Bearer token of /metrics
+METRICS_TOKEN = 'bench'
+
+# (name, method, url, form data). Reads first, then the submissions that write.
+# Detail pages use id 1, the venue/artist with the most shows.
+ROUTES = [
+    ('index', 'GET', '/', None),
+    ('venues', 'GET', '/venues', None),
+    ('show_venue', 'GET', '/venues/1', None),
+    ('venue_shows', 'GET', '/venues/1/shows/past', None),
+    ('search_venues', 'POST', '/venues/search', {'search_term': 'blue'}),
+    ('create_venue_form', 'GET', '/venues/create', None),
+    ('edit_venue', 'GET', '/venues/1/edit', None),
+    ('artists', 'GET', '/artists', None),
+    ('show_artist', 'GET', '/artists/1', None),
+    ('artist_shows', 'GET', '/artists/1/shows/past', None),
+    ('search_artists', 'POST', '/artists/search', {'search_term': 'band'}),
+    ('create_artist_form', 'GET', '/artists/create', None),
+    ('edit_artist', 'GET', '/artists/1/edit', None),
+    ('shows', 'GET', '/shows', None),
+    ('search_shows', 'POST', '/shows/search', {'search_term': 'lounge'}),
+    ('create_shows', 'GET', '/shows/create', None),
+    ('page_cache_stats', 'GET', '/cache/stats', None),
+    ('metrics', 'GET', '/metrics', None),
+    ('api_venues', 'GET', '/api/venues', None),
+    ('api_venue', 'GET', '/api/venues/1', None),
+    ('api_venue_shows', 'GET', '/api/venues/1/shows/past', None),
+    ('api_artists', 'GET', '/api/artists', None),
+    ('api_artist', 'GET', '/api/artists/1', None),
+    ('api_artist_shows', 'GET', '/api/artists/1/shows/past', None),
+    ('api_shows', 'GET', '/api/shows?format=ndjson', None),
+    ('create_venue_submission', 'POST', '/venues/create', VENUE_FORM),
+    ('edit_venue_submission', 'POST', '/venues/2/edit', VENUE_FORM),
+    ('create_artist_submission', 'POST', '/artists/create', ARTIST_FORM),
+    ('edit_artist_submission', 'POST', '/artists/2/edit', ARTIST_FORM),
+    ('create_show_submission', 'POST', '/shows/create', {'artist_id': '2', 'venue_id': '2', 'start_time': '2035-04-01 20:00:00'}),
+]
+
+# Most queries one request of the route may run, whatever the number of shows. The detail pages
+# load their shows, genres and related rows in a fixed number of queries (see queries.py), plus
+# the validator of conditional.py
+QUERY_BUDGETS = {
+    'show_venue': 6,
+    'show_artist': 6,
+}
+
+# Endpoints that are not benchmarked on purpose
+SKIPPED_ENDPOINTS = {'static', 'delete_venue'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=30, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route')
+    parser.add_argument('--database', help='SQLAlchemy URL of an empty database (default: in-memory SQLite)')
+    parser.add_argument('--routes', help='comma separated route names to run (default: all)')
+    parser.add_argument('--page-cache', action='store_true', help='benchmark with the LRU page cache enabled')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    return parser.parse_args()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def create_app(args):
+    # The in-memory SQLite profile, or the testing profile on --database
+    from app import create_app, db
+    overrides = {
+        # Render like production, without checking templates for changes on every request
+        'TEMPLATES_AUTO_RELOAD': False,
+        'PAGE_CACHE_BACKEND': 'lru' if args.page_cache else None,
+        # Serves /metrics, to the client of `main()`
+        'METRICS_TOKEN': METRICS_TOKEN,
+    }
+    if not args.database:
+        return create_app('memory', **overrides), db
+    overrides['SQLALCHEMY_DATABASE_URI'] = args.database
+    if args.database.startswith('sqlite'):
+        overrides['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    return create_app('testing', **overrides), db
+
+
+def bench_route(client, engine, method, url, data, iterations, warmup, budget=None):
+    from query_counter import QueryCounter, assert_max_queries
+
+    def request():
+        if method == 'GET':
+            response = client.get(url)
+        else:
+            response = client.post(url, data=data)
+        response.get_data()  # consume streamed bodies
+        response.close()
+        if response.status_code >= 400:
+            raise RuntimeError('%s %s returned %d' % (method, url, response.status_code))
+
+    for _ in range(warmup):
+        request()
+
+    timings = []
+    with QueryCounter(engine) as counter:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - started) * 1000)
+
+    # Peak memory of one request, measured separately as tracing slows Python down
+    tracemalloc.start()
+    request()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if budget is not None:
+        with assert_max_queries(engine, budget):
+            request()
+
+    return {
+        'method': method,
+        'url': url,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': round(float(counter.count) / iterations, 2),
+        'peak_kb': round(peak / 1024.0, 1),
+    }
+
+
+def print_results(results, baseline=None):
+    header = '%-26s %9s %9s %9s %8s %10s' % ('route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KB')
+    if baseline:
+        header += '   %10s %10s' % ('p50 vs old', 'queries old')
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        line = '%-26s %9.2f %9.2f %9.2f %8.2f %10.1f' % (name, result['p50_ms'], result['p95_ms'],
+            result['p99_ms'], result['queries'], result['peak_kb'])
+        old = (baseline or {}).get(name)
+        if old:
+            line += '   %9.2fx %10.2f' % (result['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 0, old['queries'])
+        print(line)
+
+
+def main():
+    args = parse_args()
+
+    app, db = create_app(args)
+    warnings.simplefilter('ignore')
+    from datagen import generate
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        counts = generate(db, venues=args.venues, artists=args.artists, genres=args.genres,
+            shows=args.shows, seed=args.seed)
+        print('Generated %s in %.1fs' % (counts, time.perf_counter() - started))
+
+        covered = set(name for (name, _, _, _) in ROUTES)
+        # Routes are named after their view, without the blueprint ('main.venues' -> 'venues')
+        endpoints = set(rule.endpoint.rsplit('.', 1)[-1] for rule in app.url_map.iter_rules())
+        missing = endpoints - covered - SKIPPED_ENDPOINTS
+        if missing:
+            print('WARNING: routes without a benchmark: %s' % ', '.join(sorted(missing)))
+
+        selected = set(args.routes.split(',')) if args.routes else covered
+        client = app.test_client()
+        client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + METRICS_TOKEN
+        results = {}
+        for name, method, url, data in ROUTES:
+            if name in selected:
+                results[name] = bench_route(client, db.engine, method, url, data, args.iterations, args.warmup,
+                    QUERY_BUDGETS.get(name))
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'database': db.get_engine(app).dialect.name,
+        'params': {'venues': args.venues, 'artists': args.artists, 'genres': args.genres,
+            'shows': args.shows, 'seed': args.seed, 'iterations': args.iterations,
+            'page_cache': args.page_cache},
+        'routes': results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old.get('params') != report['params']:
+            print('WARNING: %s was run with different parameters: %s' % (args.compare, old.get('params')))
+        print('Comparing with revision %s' % old.get('revision'))
+        baseline = old['routes']
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('Results written to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Benchmark of the show search, against the implementation it replaced.
+
+The old search_shows matched venue names only, then walked every matching
+venue's shows and lazily loaded each show's venue and artist. The new one is a
+single query matching venue names, artist names and genres, returning one page
+(see `search_shows_query()` in queries.py).
+
+    python bench/bench_search_shows.py --shows 100000
+    python bench/bench_search_shows.py --database postgresql://localhost/fyyur_bench
+
+Reports, per search term: p50 latency, SQL queries and the number of rows
+returned. The old search returns every match at once, the new one a page.
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_routes import create_app, percentile
+
+TERMS = ['blue', 'lounge', 'band', 'jazz', 'quevedo']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--terms', default=','.join(TERMS), help='comma separated search terms')
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--database', help='SQLAlchemy URL of an empty database (default: in-memory SQLite)')
+    args = parser.parse_args()
+    args.page_cache = False
+    return args
+
+
+def legacy_search_shows(search_term):
+    # The previous view body: venues by name, then their shows, then each show's venue and artist
+    from formatting import format_datetime
+    from models import Venue
+    from search import search_by_name
+
+    results = []
+    for venue in search_by_name(Venue, search_term).all():
+        for show in venue.shows:
+            results.append({
+                "venue_id": show.venues.id,
+                "venue_name": show.venues.name,
+                "venue_image_link": show.venues.image_link,
+                "artist_id": show.artists.id,
+                "artist_name": show.artists.name,
+                "is_upComingShow": datetime.today() <= show.start_time,
+                "start_time": format_datetime(show.start_time)
+            })
+    return results
+
+
+def search_shows(search_term, per_page, upcoming=False):
+    # The new view body, without the request
+    from formatting import format_datetimes
+    from models import Show
+    from pagination import keyset_paginate
+    from queries import search_shows_query, SHOWS_ORDER
+
+    now = datetime.now()
+    query = search_shows_query(search_term)
+    if upcoming:
+        page = keyset_paginate(query.filter(Show.start_time > now), SHOWS_ORDER, per_page=per_page)
+    else:
+        page = keyset_paginate(query, SHOWS_ORDER, per_page=per_page, descending=True)
+    start_times = format_datetimes([show.start_time for show in page.items])
+    return [{
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "venue_image_link": show.venue_image_link,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "is_upComingShow": show.start_time > now,
+        "start_time": start_time
+    } for show, start_time in zip(page.items, start_times)]
+
+
+def measure(db, function, iterations):
+    # (p50 ms, queries per call, rows) of `function()`, each call in a fresh session like a request
+    from query_counter import QueryCounter
+
+    timings = []
+    rows = 0
+    with QueryCounter(db.engine) as counter:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            rows = len(function())
+            timings.append((time.perf_counter() - started) * 1000)
+            db.session.remove()
+    return percentile(timings, 0.50), float(counter.count) / iterations, rows
+
+
+def main():
+    args = parse_args()
+    app, db = create_app(args)
+    warnings.simplefilter('ignore')
+    from datagen import generate
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        counts = generate(db, venues=args.venues, artists=args.artists, genres=args.genres,
+            shows=args.shows, seed=args.seed)
+        print('Generated %s in %.1fs\n' % (counts, time.perf_counter() - started))
+
+        header = '%-10s | %10s %8s %7s | %10s %8s %7s | %10s %8s %7s' % ('term', 'old ms', 'queries', 'rows',
+            'new ms', 'queries', 'rows', 'upcoming', 'queries', 'rows')
+        print(header)
+        print('-' * len(header))
+        for term in args.terms.split(','):
+            old = measure(db, lambda: legacy_search_shows(term), args.iterations)
+            new = measure(db, lambda: search_shows(term, args.per_page), args.iterations)
+            upcoming = measure(db, lambda: search_shows(term, args.per_page, upcoming=True), args.iterations)
+            print('%-10s | %10.2f %8.1f %7d | %10.2f %8.1f %7d | %10.2f %8.1f %7d' % ((term,) + old + new + upcoming))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Before/after benchmark of the Show indexes (migration 0c9f4e2a7b31).
+
+Fills a database with deterministic synthetic data (datagen.py), then times the
+venue and artist detail pages, and the query loading their shows, first without
+the (venue_id, start_time), (artist_id, start_time) and (start_time) indexes and
+then with them, on the same rows. Prints the query plan of both runs.
+
+    python bench/bench_show_indexes.py --shows 1000000
+    python bench/bench_show_indexes.py --database postgresql://localhost/fyyur_bench --shows 10000000
+
+Venues and artists are picked by popularity rank (--ids): with the Zipf-like
+weights of datagen.py id 1 has the most shows and the shows per id fall quickly.
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_routes import create_app, percentile
+
+INDEXES = ('ix_Show_venue_id_start_time', 'ix_Show_artist_id_start_time', 'ix_Show_start_time')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--shows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ids', default='10,100,1000', help='comma separated venue/artist ids to request')
+    parser.add_argument('--iterations', type=int, default=10, help='timed requests per page')
+    parser.add_argument('--database', help='SQLAlchemy URL of an empty database (default: in-memory SQLite)')
+    args = parser.parse_args()
+    args.page_cache = False
+    return args
+
+
+def show_indexes(db):
+    from models import Show
+    return [index for index in Show.__table__.indexes if index.name in INDEXES]
+
+
+def analyze(db):
+    # Fresh planner statistics after the indexes change
+    from sqlalchemy import text
+    with db.engine.begin() as connection:
+        connection.execute(text('ANALYZE "Show"' if db.engine.dialect.name == 'postgresql' else 'ANALYZE'))
+
+
+def explain(db, statement, params):
+    from sqlalchemy import text
+    prefix = 'EXPLAIN ' if db.engine.dialect.name == 'postgresql' else 'EXPLAIN QUERY PLAN '
+    with db.engine.connect() as connection:
+        return [' '.join(str(value) for value in row) for row in connection.execute(text(prefix + statement), params)]
+
+
+def shows_statement(column):
+    # The statement the detail pages load a venue's/artist's shows with (see queries.py)
+    return 'SELECT id, start_time FROM "Show" WHERE %s = :id ORDER BY start_time DESC' % column
+
+
+def timed(function, iterations):
+    function()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return percentile(timings, 0.50)
+
+
+def run(app, db, args, ids):
+    # p50 latency (ms) of every page and of its shows query, as {(kind, id): (page, query)}
+    from sqlalchemy import text
+    client = app.test_client()
+    results = {}
+    for kind, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        statement = text(shows_statement(column))
+        for id in ids:
+            def page():
+                response = client.get('/%s/%d' % (kind, id))
+                response.get_data()
+                response.close()
+                if response.status_code != 200:
+                    raise RuntimeError('/%s/%d returned %d' % (kind, id, response.status_code))
+
+            def query():
+                with db.engine.connect() as connection:
+                    connection.execute(statement, {'id': id}).fetchall()
+
+            results[(kind, id)] = (timed(page, args.iterations), timed(query, args.iterations))
+    return results
+
+
+def main():
+    args = parse_args()
+    ids = [int(id) for id in args.ids.split(',')]
+
+    app, db = create_app(args)
+    warnings.simplefilter('ignore')
+    from datagen import generate
+    from sqlalchemy import func
+    from models import Show
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        counts = generate(db, venues=args.venues, artists=args.artists, genres=args.genres,
+            shows=args.shows, seed=args.seed)
+        print('Generated %s in %.1fs' % (counts, time.perf_counter() - started))
+
+        shows_per_id = {}
+        for kind, column in (('venues', Show.venue_id), ('artists', Show.artist_id)):
+            for id in ids:
+                shows_per_id[(kind, id)] = db.session.query(func.count(Show.id)).filter(column == id).scalar()
+        db.session.remove()
+
+        indexes = show_indexes(db)
+        for index in indexes:
+            index.drop(bind=db.engine)
+        analyze(db)
+        print('\nWithout indexes:')
+        print('\n'.join('  ' + line for line in explain(db, shows_statement('venue_id'), {'id': ids[0]})))
+        before = run(app, db, args, ids)
+
+        started = time.perf_counter()
+        for index in indexes:
+            index.create(bind=db.engine)
+        analyze(db)
+        print('\nWith indexes (built in %.1fs):' % (time.perf_counter() - started))
+        print('\n'.join('  ' + line for line in explain(db, shows_statement('venue_id'), {'id': ids[0]})))
+        after = run(app, db, args, ids)
+
+    header = '\n%-14s %8s %12s %12s %8s %12s %12s %8s' % ('page', 'shows', 'page before', 'page after',
+        'speedup', 'query before', 'query after', 'speedup')
+    print(header)
+    print('-' * (len(header) - 1))
+    for key in before:
+        (page_before, query_before), (page_after, query_after) = before[key], after[key]
+        print('%-14s %8d %10.2fms %10.2fms %7.1fx %10.2fms %10.2fms %7.1fx' % (
+            '/%s/%d' % key, shows_per_id[key], page_before, page_after, page_before / page_after,
+            query_before, query_after, query_before / query_after))
+
+
+if __name__ == '__main__':
+    main()
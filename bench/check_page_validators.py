@@ -0,0 +1,100 @@
+"""Checks that cached pages are never sent under a newer ETag than they were rendered for.
+
+Fills an in-memory SQLite database (the 'memory' profile of config.py) with
+deterministic synthetic data (datagen.py), enables the LRU page cache and
+conditional requests, then for /venues/<id>, /artists/<id> and their JSON:
+
+  - a show starts: the page cached while it was upcoming must not be sent with
+    the ETag of the page where it is past
+  - another worker edits the venue/artist: simulated by committing the edit
+    without invalidating this process' page cache, which only that worker would do
+
+After each change, the page must be a fresh rendering (the same as with the page
+cache cleared), and revalidating it with its new ETag must get a 304.
+
+    python bench/check_page_validators.py
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# Seconds until the show of the check starts
+STARTS_IN = 2
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=50)
+    parser.add_argument('--artists', type=int, default=100)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--shows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+
+def fetch(client, url, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    response = client.get(url, headers=headers)
+    if response.status_code not in (200, 304):
+        raise RuntimeError('GET %s returned %d' % (url, response.status_code))
+    return response
+
+
+def check(client, page_cache, url, before, change):
+    # `before`: the cached response of `url` before `change`
+    response = fetch(client, url, before.headers['ETag'])
+    assert response.status_code == 200, '%s %s: still 304 after the change' % (url, change)
+    assert response.headers['ETag'] != before.headers['ETag'], '%s %s: same ETag' % (url, change)
+    assert response.get_data() != before.get_data(), '%s %s: cached body sent with the new ETag' % (url, change)
+
+    page_cache.backend.clear()
+    assert fetch(client, url).get_data() == response.get_data(), '%s %s: not a fresh rendering' % (url, change)
+    assert fetch(client, url, response.headers['ETag']).status_code == 304, '%s %s: no 304' % (url, change)
+    print('ok  %-18s %s' % (url, change))
+
+
+def main():
+    args = parse_args()
+
+    from app import create_app, db
+    from models import Artist, Show, Venue
+    from page_cache import page_cache
+    warnings.simplefilter('ignore')
+    from datagen import generate
+
+    app = create_app('memory', TEMPLATES_AUTO_RELOAD=False, PAGE_CACHE_BACKEND='lru', CONDITIONAL_REQUESTS=True)
+    with app.app_context():
+        db.create_all()
+        generate(db, venues=args.venues, artists=args.artists, genres=args.genres, shows=args.shows,
+            seed=args.seed)
+        client = app.test_client()
+
+        # The pages of venue 1 and artist 1, whose new show starts in STARTS_IN seconds
+        urls = ['/venues/1', '/artists/1', '/api/venues/1', '/api/artists/1']
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime.now() + timedelta(seconds=STARTS_IN)))
+        db.session.commit()
+        before = dict((url, fetch(client, url)) for url in urls)
+        time.sleep(STARTS_IN + 1)
+        for url in urls:
+            check(client, page_cache, url, before[url], 'after a show started')
+
+        # Edits committed by another worker, without the invalidation of this process' cache
+        before = dict((url, fetch(client, url)) for url in urls)
+        for model in (Venue, Artist):
+            db.session.query(model).filter(model.id == 1).update(
+                {model.name: 'Renamed elsewhere', model.updated_at: datetime.utcnow()})
+        db.session.commit()
+        for url in urls:
+            check(client, page_cache, url, before[url], 'after an edit')
+
+    print('All checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Deterministic synthetic data for benchmarks.
+
+Generates venues, artists, genres and shows with a realistic skew: a few big
+cities hold most venues, and a few popular venues and artists play most shows
+(Zipf-like weights). The same arguments always produce the same rows, so runs
+on different commits measure the same data.
+
+    from datagen import generate
+    counts = generate(db, venues=1000, artists=2000, genres=30, shows=20000)
+
+Show start times are spread around 8pm of the current day (`now`), so the
+past/upcoming split looks the same whichever day the benchmark runs.
+"""
+import itertools
+import random
+from datetime import date, datetime, time, timedelta
+
+from models import Genre, Venue, Artist, Show, genres_venues, genres_artists
+from rollups import rebuild_show_counts
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('San Francisco', 'CA'), ('Seattle', 'WA'), ('Austin', 'TX'), ('Nashville', 'TN'),
+    ('New Orleans', 'LA'), ('Denver', 'CO'), ('Boston', 'MA'), ('Atlanta', 'GA'),
+    ('Portland', 'OR'), ('Miami', 'FL'), ('Detroit', 'MI'), ('Minneapolis', 'MN'),
+    ('Philadelphia', 'PA'), ('Phoenix', 'AZ'), ('Kansas City', 'MO'), ('Memphis', 'TN'),
+]
+
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+]
+
+ADJECTIVES = ['Blue', 'Golden', 'Velvet', 'Electric', 'Silver', 'Wild', 'Midnight', 'Crimson',
+    'Lucky', 'Rusty', 'Neon', 'Hidden', 'Broken', 'Sunset', 'Iron', 'Little']
+NOUNS = ['Note', 'Lounge', 'Hop', 'Room', 'Garden', 'Cellar', 'Tavern', 'Hall', 'Palace',
+    'Pianos', 'Sax', 'Petals', 'Rose', 'Crow', 'Owl', 'Harbor', 'Station', 'Club']
+VENUE_KINDS = ['Bar', 'Live Music & Coffee', 'Theatre', 'Club', 'Jazz Bar', 'Music Hall', 'Arena']
+ARTIST_KINDS = ['Band', 'Quartet', 'Trio', 'Collective', 'Orchestra', 'Project', 'Ensemble']
+FIRST_NAMES = ['Matt', 'Ana', 'Kavin', 'Lena', 'Omar', 'Priya', 'Jonas', 'Maya', 'Theo', 'Zoe']
+LAST_NAMES = ['Quevedo', 'Raju', 'Ortiz', 'Novak', 'Okafor', 'Lindqvist', 'Haddad', 'Moreau']
+
+
+def zipf_cum_weights(count, exponent=1.1):
+    # Cumulative weights for `random.choices()`: item i is picked ~1/(i+1)^exponent as often as item 0
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def venue_name(rnd, i):
+    return 'The %s %s %s #%d' % (rnd.choice(ADJECTIVES), rnd.choice(NOUNS), rnd.choice(VENUE_KINDS), i)
+
+
+def artist_name(rnd, i):
+    if rnd.random() < 0.4:
+        return '%s %s #%d' % (rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES), i)
+    return 'The %s %s %s #%d' % (rnd.choice(ADJECTIVES), rnd.choice(NOUNS), rnd.choice(ARTIST_KINDS), i)
+
+
+def insert(db, table, rows, batch_size=5000):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[start:start + batch_size])
+
+
+def generate(db, venues=1000, artists=2000, genres=30, shows=20000, seed=42, now=None):
+    # Inserts the rows (ids start at 1) and returns the number of rows per table
+    rnd = random.Random(seed)
+    now = now or datetime.combine(date.today(), time(20, 0))
+
+    genre_names = (GENRES + ['Genre %d' % i for i in range(len(GENRES), genres)])[:genres]
+    insert(db, Genre.__table__, [{'id': i + 1, 'name': name} for i, name in enumerate(genre_names)])
+    genre_weights = zipf_cum_weights(len(genre_names), 0.8)
+    genre_ids = range(1, len(genre_names) + 1)
+
+    city_weights = zipf_cum_weights(len(CITIES), 1.0)
+    venue_rows = []
+    venue_genre_rows = []
+    for i in range(1, venues + 1):
+        city, state = rnd.choices(CITIES, cum_weights=city_weights)[0]
+        venue_rows.append({
+            'id': i, 'name': venue_name(rnd, i), 'city': city, 'state': state,
+            'address': '%d %s Street' % (rnd.randint(1, 9999), rnd.choice(NOUNS)),
+            'phone': '%03d-%03d-%04d' % (rnd.randint(200, 999), rnd.randint(0, 999), rnd.randint(0, 9999)),
+            'image_link': 'https://images.example.com/venues/%d.jpg' % i,
+            'facebook_link': 'https://www.facebook.com/venue%d' % i,
+            'website': 'https://venue%d.example.com' % i,
+            'seeking_talent': rnd.random() < 0.3,
+            'seeking_description': 'Looking for local artists.' if rnd.random() < 0.3 else None,
+        })
+        for genre_id in set(rnd.choices(genre_ids, cum_weights=genre_weights, k=rnd.randint(1, 4))):
+            venue_genre_rows.append({'genre_id': genre_id, 'venue_id': i})
+
+    artist_rows = []
+    artist_genre_rows = []
+    for i in range(1, artists + 1):
+        city, state = rnd.choices(CITIES, cum_weights=city_weights)[0]
+        artist_rows.append({
+            'id': i, 'name': artist_name(rnd, i), 'city': city, 'state': state,
+            'phone': '%03d-%03d-%04d' % (rnd.randint(200, 999), rnd.randint(0, 999), rnd.randint(0, 9999)),
+            'image_link': 'https://images.example.com/artists/%d.jpg' % i,
+            'facebook_link': 'https://www.facebook.com/artist%d' % i,
+            'website': None if rnd.random() < 0.5 else 'https://artist%d.example.com' % i,
+            'seeking_venue': rnd.random() < 0.4,
+            'seeking_description': None,
+        })
+        for genre_id in set(rnd.choices(genre_ids, cum_weights=genre_weights, k=rnd.randint(1, 3))):
+            artist_genre_rows.append({'genre_id': genre_id, 'artist_id': i})
+
+    insert(db, Venue.__table__, venue_rows)
+    insert(db, Artist.__table__, artist_rows)
+    insert(db, genres_venues, venue_genre_rows)
+    insert(db, genres_artists, artist_genre_rows)
+
+    # Most shows are in the past (five years back), some are upcoming (one year ahead)
+    venue_weights = zipf_cum_weights(venues)
+    artist_weights = zipf_cum_weights(artists)
+    venue_ids = range(1, venues + 1)
+    artist_ids = range(1, artists + 1)
+    # Inserted as they are generated, so millions of shows don't have to fit in memory
+    show_rows = []
+    for i in range(1, shows + 1):
+        show_rows.append({
+            'id': i,
+            'venue_id': rnd.choices(venue_ids, cum_weights=venue_weights)[0],
+            'artist_id': rnd.choices(artist_ids, cum_weights=artist_weights)[0],
+            'start_time': now + timedelta(hours=rnd.randint(-5 * 365 * 24, 365 * 24)),
+        })
+        if len(show_rows) == 50000:
+            insert(db, Show.__table__, show_rows)
+            show_rows = []
+    insert(db, Show.__table__, show_rows)
+    db.session.commit()
+    # The upcoming/past show counts of the venues and artists
+    rebuild_show_counts()
+
+    return {
+        'genres': len(genre_names),
+        'venues': venues,
+        'artists': artists,
+        'shows': shows,
+        'genres_venues': len(venue_genre_rows),
+        'genres_artists': len(artist_genre_rows),
+    }
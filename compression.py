@@ -0,0 +1,151 @@
+import zlib
+import brotli
+from flask import request
+from metrics import request_metrics
+
+### Response Compression
+# Compresses the HTML and JSON responses (the listings and searches are large
+# and repetitive) with brotli or gzip, whichever the browser prefers in its
+# Accept-Encoding (brotli on a tie).
+#
+# It runs as an after_request hook, so it applies to every view, the async views
+# of the ASGI mode included:
+#   - complete responses are compressed at once, when at least
+#     COMPRESSION_MIN_SIZE bytes long (a smaller body isn't worth it)
+#   - streamed responses (the /api listings, see streaming.py) are compressed
+#     chunk by chunk as the view produces them, each chunk flushed to the
+#     client, so they stay streamed and are never held in memory
+# Responses that already have a Content-Encoding (the precompressed assets of
+# static/dist/, see assets.py), files sent from disk, other media types and
+# anything but a 200 are left alone.
+#
+# A compressed body is another representation, so its strong ETag gets the
+# encoding appended, e.g. "3f2a...-br"; conditional.py recognizes those when
+# revalidating (see `etag_variants()`).
+#
+# The input size and the bytes saved are counted per endpoint at /metrics (see
+# metrics.py). COMPRESSION_ENABLED = False (config.py) turns it off.
+
+COMPRESSIBLE = ('text/html', 'text/plain', 'text/css', 'application/json', 'application/x-ndjson',
+    'application/javascript', 'image/svg+xml')
+# Content-Encoding -> ETag suffix
+ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gzip'}
+
+
+def etag_variants(etag):
+    # `etag` and the ETags of its compressed representations
+    return [etag] + [etag + suffix for suffix in ETAG_SUFFIXES.values()]
+
+
+class Compressor(object):
+    # One body's brotli or gzip stream. `compress(chunk)` returns the compressed bytes available so
+    # far, flushed when `flush`; `finish()` returns the rest
+
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=brotli_quality)
+            self._compress, self._flush, self._finish = self.compressor.process, self.compressor.flush, \
+                self.compressor.finish
+        else:
+            # wbits 31: a gzip header and trailer around the deflate stream
+            self.compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._compress, self._flush, self._finish = self.compressor.compress, \
+                lambda: self.compressor.flush(zlib.Z_SYNC_FLUSH), self.compressor.flush
+        self.size = 0
+        self.compressed_size = 0
+
+    def compress(self, chunk, flush=False):
+        self.size += len(chunk)
+        data = self._compress(chunk)
+        if flush:
+            data += self._flush()
+        self.compressed_size += len(data)
+        return data
+
+    def finish(self):
+        data = self._finish()
+        self.compressed_size += len(data)
+        return data
+
+
+class CompressedStream(object):
+    # The chunks of a streamed response, compressed. Closing it closes the response's own iterable,
+    # e.g. the generator of `stream_with_context()`, and counts the bytes
+
+    def __init__(self, chunks, iterable, compressor, endpoint):
+        self.chunks = chunks
+        self.iterable = iterable
+        self.compressor = compressor
+        self.endpoint = endpoint
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            data = self.compressor.compress(chunk, flush=True)
+            if data:
+                yield data
+        yield self.compressor.finish()
+
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+        request_metrics.record_compression(self.endpoint, self.compressor.size, self.compressor.compressed_size)
+
+
+class ResponseCompression(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESSION_ENABLED', True)
+        if not self.enabled:
+            return
+        self.min_size = app.config.get('COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = app.config.get('COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY', 4)
+        app.after_request(self._after_request)
+
+    def negotiate(self):
+        # 'br', 'gzip' or None, from the request's Accept-Encoding
+        accepted = request.accept_encodings
+        br, gzip = accepted['br'], accepted['gzip']
+        if br and br >= gzip:
+            return 'br'
+        return 'gzip' if gzip else None
+
+    def _after_request(self, response):
+        if response.status_code != 200 or response.mimetype not in COMPRESSIBLE or response.direct_passthrough \
+                or 'Content-Encoding' in response.headers or response.cache_control.no_transform:
+            return response
+        # Whether the body is compressed depends on the header, for every response of this type
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+        if response.is_streamed:
+            response.response = CompressedStream(response.iter_encoded(), response.response, compressor,
+                request.endpoint)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            compressed = compressor.compress(data) + compressor.finish()
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+            request_metrics.record_compression(request.endpoint, len(data), len(compressed))
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(etag + ETAG_SUFFIXES[encoding], weak)
+        return response
+
+
+response_compression = ResponseCompression()
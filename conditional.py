@@ -0,0 +1,217 @@
+import hashlib
+import inspect
+import os
+from datetime import datetime, timezone
+from functools import wraps
+from flask import g, request, session, make_response, Response
+from sqlalchemy import func, select
+from assets import DIST, MANIFEST
+from async_db import async_db
+from compression import etag_variants
+from models import *
+from rollups import NAME as SHOW_COUNTS
+
+### Conditional Requests
+# The listings, the venue/artist pages and their JSON (/api/...) carry a strong
+# ETag and a Last-Modified, and a request revalidating them (If-None-Match, or
+# If-Modified-Since without it) is answered 304 Not Modified before the view runs:
+# no page query, no rendering, no page cache lookup.
+#
+# What a page shows is summed up by a validator: one row of timestamps, read by a
+# single query on index entries only:
+#   - `updated_at` of the venue/artist of a detail page, or the highest one of the
+#     tables of a listing (the `ix_<table>_updated_at` indexes). The edit
+#     submissions set it, and a new show bumps its venue and artist (rollups.py)
+#   - on a detail page, the highest `updated_at` of the artists/venues its shows
+#     list, whose names and images are on the page
+#   - the start of the last show the venue/artist played, which moves a show from
+#     "upcoming" to "past" on its page without anything being written
+#   - the watermark of the show count rollups (rollups.py) on /venues, whose
+#     upcoming counts change with every roll
+# The ETag hashes the validator with the page's URL and the version of the code
+# and templates rendering it, so a deploy changes every ETag.
+# Compressed responses carry it with their encoding appended (compression.py), and
+# revalidating any of those variants gets the 304.
+#
+# Timestamps are UTC (`updated_at`) or local time (show start times and the
+# watermark, compared to `datetime.now()`), see LOCAL_TIMES.
+#
+# The ETag is also part of the page cache key (page_cache.py), so a page is never
+# sent from a cache entry older than its ETag.
+#
+# Pages carrying flashed messages are sent without validators, like they skip the
+# page cache. CONDITIONAL_REQUESTS = False (config.py) turns all of this off.
+
+# Validator columns in local time
+LOCAL_TIMES = ('last_started', 'rolled_at')
+
+
+def last_started(column, owner_id, now):
+    # Start time of the last show of the venue/artist `owner_id` of `column` that started by `now`
+    return select(func.max(Show.start_time)).where(column == owner_id, Show.start_time <= now).scalar_subquery()
+
+
+def rollup_watermark():
+    return select(Rollup.rolled_at).where(Rollup.name == SHOW_COUNTS).scalar_subquery()
+
+
+def partners_updated(partner, column, owner_id):
+    # Highest `updated_at` of the artists/venues (`partner`) of the shows of the venue/artist `owner_id`
+    # of `column`
+    partner_column = Show.artist_id if partner is Artist else Show.venue_id
+    return select(func.max(partner.updated_at)).select_from(Show).join(partner, partner.id == partner_column) \
+        .where(column == owner_id).scalar_subquery()
+
+
+def venue_validator(venue_id, **kwargs):
+    # /venues/<id>, its show pages and their JSON
+    now = datetime.now()
+    return db.session.query(Venue.updated_at.label('updated_at'),
+        partners_updated(Artist, Show.venue_id, venue_id).label('artists'),
+        last_started(Show.venue_id, venue_id, now).label('last_started')).filter(Venue.id == venue_id)
+
+
+def artist_validator(artist_id, **kwargs):
+    # /artists/<id>, its show pages and their JSON
+    now = datetime.now()
+    return db.session.query(Artist.updated_at.label('updated_at'),
+        partners_updated(Venue, Show.artist_id, artist_id).label('venues'),
+        last_started(Show.artist_id, artist_id, now).label('last_started')).filter(Artist.id == artist_id)
+
+
+def venues_validator(**kwargs):
+    # /venues and /api/venues: venue names and their upcoming counts
+    return db.session.query(select(func.max(Venue.updated_at)).scalar_subquery().label('venues'),
+        rollup_watermark().label('rolled_at'))
+
+
+def artists_validator(**kwargs):
+    # /artists and /api/artists
+    return db.session.query(select(func.max(Artist.updated_at)).scalar_subquery().label('artists'))
+
+
+def shows_validator(**kwargs):
+    # /shows and /api/shows: the shows with their venue and artist names
+    return db.session.query(*[select(func.max(model.updated_at)).scalar_subquery().label(model.__tablename__)
+        for model in (Show, Venue, Artist)])
+
+
+def source_version(root):
+    # Digest of the app's modules and templates, which render the pages the ETags stand for, and of
+    # the asset manifest, whose hashed URLs are on every page (see assets.py)
+    digest = hashlib.sha1()
+    paths = [os.path.join(root, name) for name in os.listdir(root) if name.endswith('.py')]
+    for directory, _, files in os.walk(os.path.join(root, 'templates')):
+        paths += [os.path.join(directory, name) for name in files]
+    paths += [path for path in [os.path.join(root, 'static', DIST, MANIFEST)] if os.path.isfile(path)]
+    for path in sorted(paths):
+        with open(path, 'rb') as f:
+            digest.update(path[len(root):].encode('utf-8'))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def to_utc(value, local):
+    if local:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ConditionalRequests(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.version = ''
+        self.not_modified = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CONDITIONAL_REQUESTS', True)
+        if self.enabled:
+            self.version = source_version(app.root_path)
+
+    def conditional(self, validator):
+        # Answers the request with 304 when the page it revalidates is unchanged, and sends the
+        # validators of the view's response otherwise. `validator(**view arguments)` is a Query of
+        # one row of timestamps (see above), None when the page doesn't exist.
+        # Goes under @replicas.read_only, so the validator is read from the database the page is.
+        # The view can be a coroutine (see async_views.py)
+        def decorator(view):
+            if inspect.iscoroutinefunction(view):
+                @wraps(view)
+                async def async_wrapper(**kwargs):
+                    if not self.applies():
+                        return await view(**kwargs)
+                    async with async_db.session() as db_session:
+                        row = (await db_session.execute(validator(**kwargs).statement)).first()
+                    if row is None:
+                        return await view(**kwargs)
+                    etag, last_modified = self.validators(row)
+                    fresh = self.fresh_etag(etag, last_modified)
+                    if fresh:
+                        return self.not_modified_response(fresh, last_modified)
+                    g.page_etag = etag
+                    return self.with_validators(await view(**kwargs), etag, last_modified)
+                return async_wrapper
+
+            @wraps(view)
+            def wrapper(**kwargs):
+                if not self.applies():
+                    return view(**kwargs)
+                row = validator(**kwargs).first()
+                if row is None:
+                    return view(**kwargs)
+                etag, last_modified = self.validators(row)
+                fresh = self.fresh_etag(etag, last_modified)
+                if fresh:
+                    return self.not_modified_response(fresh, last_modified)
+                g.page_etag = etag
+                return self.with_validators(view(**kwargs), etag, last_modified)
+            return wrapper
+        return decorator
+
+    def applies(self):
+        return self.enabled and request.method in ('GET', 'HEAD') and not session.get('_flashes')
+
+    def validators(self, row):
+        # (ETag, Last-Modified) of the page of the validator `row`
+        values = row._mapping
+        parts = [self.version, request.endpoint, request.full_path]
+        parts += ['%s=%s' % (key, value.isoformat() if value is not None else '') for key, value in values.items()]
+        etag = hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+        times = [to_utc(value, key in LOCAL_TIMES) for key, value in values.items() if value is not None]
+        last_modified = max(times).replace(tzinfo=timezone.utc) if times else None
+        return etag, last_modified
+
+    def fresh_etag(self, etag, last_modified):
+        # The ETag of the representation the request revalidates when it is still fresh, None otherwise.
+        # RFC 7232: If-None-Match decides when present, If-Modified-Since otherwise. A compressed
+        # page's ETag carries its encoding (see compression.py)
+        if request.if_none_match:
+            if request.if_none_match.star_tag:
+                return etag
+            return next((tag for tag in etag_variants(etag) if request.if_none_match.contains(tag)), None)
+        since = request.if_modified_since
+        if since is not None and last_modified is not None and last_modified.replace(microsecond=0) <= since:
+            return etag
+        return None
+
+    def not_modified_response(self, etag, last_modified):
+        self.not_modified += 1
+        return self.set_validators(Response(status=304), etag, last_modified)
+
+    def with_validators(self, rv, etag, last_modified):
+        response = make_response(rv)
+        if response.status_code == 200:
+            self.set_validators(response, etag, last_modified)
+        return response
+
+    def set_validators(self, response, etag, last_modified):
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        # Browsers revalidate on every visit instead of guessing a freshness from Last-Modified
+        response.cache_control.no_cache = True
+        return response
+
+
+conditional_requests = ConditionalRequests()
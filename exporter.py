@@ -0,0 +1,164 @@
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from models import *
+
+### Bulk Export
+# Dumps venues, artists, shows and genres to CSV or JSON Lines files, one per table:
+#
+#   $ flask export-data --output-dir dumps/2026-10-18 --gzip
+#   $ flask export-data --since "2026-10-17 02:00:00" --format jsonl
+#
+# Rows are read from a server-side cursor (stream_results) `batch_size` at a
+# time and written straight to the file, so memory stays the same whatever the
+# size of the tables. Venues and artists carry their genre names, aggregated by
+# the database in one grouped subquery, so no relationship is ever loaded.
+#
+# --since only exports the venues, artists and shows whose `updated_at` is at or
+# after the given time (UTC), and only aggregates the genres of those.
+#
+# Each run prints the --since of the next incremental run: the time it started,
+# minus SINCE_OVERLAP. A row is stamped before its transaction commits (an
+# import batch, or PostgreSQL's now(), the start of the transaction), and a
+# replica lags behind, so a row stamped just before the run may only become
+# visible after it. The overlap exports it with the next run. Rows changed within
+# the overlap are exported by both runs, so a consumer must load a dump as
+# upserts by id.
+#
+# The dump is read from a read replica when one is configured (see replicas.py).
+#
+# The columns are those `flask import-data` reads (see importer.py), plus
+# `updated_at`, so a dump can be loaded into another database.
+
+TABLES = ('genres', 'venues', 'artists', 'shows')
+# How long before its start the next incremental export starts again, see above
+SINCE_OVERLAP = timedelta(minutes=5)
+
+
+def next_since(started):
+    # The --since of the export after one started at `started`
+    return started - SINCE_OVERLAP
+
+
+def genre_names(association, key, model, since=None):
+    # (id, comma separated genre names) of every venue/artist with genres, or of those changed
+    # since `since`, aggregated in one pass
+    if db.engine.dialect.name == 'postgresql':
+        names = func.string_agg(Genre.name, ',')
+    else:
+        names = func.group_concat(Genre.name, ',')
+    query = (
+        select(association.c[key].label('id'), names.label('genres'))
+        .select_from(association.join(Genre, Genre.id == association.c.genre_id))
+    )
+    if since is not None:
+        query = query.where(association.c[key].in_(filter_since(select(model.id), model, since)))
+    return query.group_by(association.c[key]).subquery()
+
+
+def export_query(table, since=None):
+    if table == 'genres':
+        return select(Genre.id, Genre.name).order_by(Genre.id)
+
+    if table == 'venues':
+        model = Venue
+        genres = genre_names(genres_venues, 'venue_id', Venue, since)
+        columns = [Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+            genres.c.genres, Venue.image_link, Venue.facebook_link,
+            Venue.website, Venue.seeking_talent, Venue.seeking_description, Venue.updated_at]
+    elif table == 'artists':
+        model = Artist
+        genres = genre_names(genres_artists, 'artist_id', Artist, since)
+        columns = [Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+            genres.c.genres, Artist.image_link, Artist.facebook_link,
+            Artist.website, Artist.seeking_venue, Artist.seeking_description, Artist.updated_at]
+    else:
+        return filter_since(select(Show.id, Show.artist_id, Show.venue_id, Show.start_time, Show.updated_at)
+            .order_by(Show.id), Show, since)
+
+    query = select(*columns).select_from(model.__table__.outerjoin(genres, genres.c.id == model.id))
+    return filter_since(query.order_by(model.id), model, since)
+
+
+def filter_since(query, model, since):
+    if since is not None:
+        query = query.where(model.updated_at >= since)
+    return query
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def json_value(key, value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if key == 'genres':
+        return value.split(',') if value else []
+    return value
+
+
+class Writer(object):
+    # Writes rows to <directory>/<table>.csv or .jsonl, gzipped when `compress`
+
+    def __init__(self, directory, table, format, compress):
+        self.format = format
+        self.path = os.path.join(directory, '%s.%s%s' % (table, format, '.gz' if compress else ''))
+        if compress:
+            self.file = gzip.open(self.path, 'wt', encoding='utf-8', newline='')
+        else:
+            self.file = open(self.path, 'w', encoding='utf-8', newline='')
+        self.csv = None
+
+    def write_header(self, keys):
+        self.keys = list(keys)
+        if self.format == 'csv':
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(self.keys)
+
+    def write_rows(self, rows):
+        if self.format == 'csv':
+            self.csv.writerows([csv_value(value) for value in row] for row in rows)
+        else:
+            keys = self.keys
+            self.file.write(''.join(
+                json.dumps(dict((key, json_value(key, value)) for key, value in zip(keys, row))) + '\n'
+                for row in rows))
+
+    def close(self):
+        self.file.close()
+
+
+def export_table(engine, table, directory, format='csv', compress=False, since=None, batch_size=5000):
+    # Streams one table to its file and returns (path, number of rows)
+    writer = Writer(directory, table, format, compress)
+    count = 0
+    try:
+        with engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(export_query(table, since))
+            writer.write_header(result.keys())
+            for rows in result.partitions(batch_size):
+                writer.write_rows(rows)
+                count += len(rows)
+    finally:
+        writer.close()
+    return writer.path, count
+
+
+def export_tables(engine, directory, tables=TABLES, format='csv', compress=False, since=None, batch_size=5000):
+    # Exports `tables` from `engine` and yields (table, path, rows, seconds) as each one is done
+    os.makedirs(directory, exist_ok=True)
+    for table in tables:
+        started = time.perf_counter()
+        # Genres have no updated_at and are few, so they are always exported in full
+        path, count = export_table(engine, table, directory, format, compress,
+            since=since if table != 'genres' else None, batch_size=batch_size)
+        yield table, path, count, time.perf_counter() - started
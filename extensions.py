@@ -0,0 +1,12 @@
+from flask_migrate import Migrate
+from flask_moment import Moment
+from replicas import RoutingSQLAlchemy
+
+### Extensions
+# Created without an app, and bound to one by `create_app()` in app.py.
+# Modules that need the database import `db` from here, not from app.py.
+
+# Reads of the read-only views can go to a replica, see replicas.py
+db = RoutingSQLAlchemy()
+migrate = Migrate()
+moment = Moment()
@@ -0,0 +1,64 @@
+from functools import lru_cache
+from datetime import datetime, timezone
+import dateutil.parser
+import babel.dates
+from babel import Locale
+
+### Date Formatting
+# `format_datetime()` is called for every show on every listing, so it keeps
+# the per-call work down to formatting:
+#   - `datetime` values are formatted directly, without the str() -> parse round trip,
+#   - strings (e.g. from the Jinja `datetime` filter) are parsed once per distinct value,
+#   - the compiled babel pattern and the babel Locale are built once per format/locale.
+
+# Our named formats. Anything else is passed to babel as a pattern or babel format name.
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# Adding locale='en' solved: AttributeError: 'NoneType' object has no attribute 'days'
+DEFAULT_LOCALE = 'en'
+
+
+@lru_cache(maxsize=None)
+def get_locale(locale):
+    return Locale.parse(locale)
+
+
+@lru_cache(maxsize=None)
+def get_pattern(format):
+    # Compiled babel pattern of a named format or a custom pattern
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value):
+    return dateutil.parser.parse(value)
+
+
+def format_datetime(value, format='medium', locale=DEFAULT_LOCALE):
+    # Formats a `datetime` or a date string, e.g. format_datetime(show.start_time, 'full')
+    if isinstance(value, str):
+        value = parse_datetime(value)
+
+    if format in ('long', 'short') and format not in DATETIME_FORMATS:
+        return babel.dates.format_datetime(value, format, locale=locale)
+
+    # babel treats naive datetimes as UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return get_pattern(format).apply(value, get_locale(locale))
+
+
+def format_datetimes(values, format='medium', locale=DEFAULT_LOCALE):
+    # Formats a list of datetimes (e.g. the start times of a page of shows) in one call.
+    # Shows often share a start time, so each distinct value is formatted once.
+    formatted = {}
+    result = []
+    for value in values:
+        text = formatted.get(value)
+        if text is None:
+            text = formatted[value] = format_datetime(value, format, locale)
+        result.append(text)
+    return result
@@ -0,0 +1,90 @@
+import threading
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import *
+
+### Genre Cache
+# Genres are a small, append-only table: a name is inserted once and never
+# renamed or deleted. So every worker keeps a name -> id dictionary of them,
+# loaded by the first submission it serves, and the create/edit submissions
+# turn the selected genre names into `Genre` objects without querying for them.
+#
+# Names that are not cached yet are inserted with one
+#   INSERT INTO "Genre" (name) VALUES ... ON CONFLICT (name) DO NOTHING
+# (relying on the unique index on Genre.name, migration 892b573ac5fa) followed by
+# one SELECT of their ids. Both run in the request's transaction, and the new ids
+# are only added to the cache once that transaction commits.
+
+class GenreCache(object):
+
+    def __init__(self):
+        self.ids = {}  # name -> id
+        self.warmed = False
+        self.lock = threading.Lock()
+
+    def warm(self):
+        ids = dict((name, id) for (id, name) in db.session.query(Genre.id, Genre.name))
+        with self.lock:
+            self.ids = ids
+            self.warmed = True
+
+    def get_ids(self, names):
+        # Returns {name: id} of `names`, inserting the genres that do not exist yet
+        if not self.warmed:
+            # Two requests loading it at once both read the same table, one of them wins
+            self.warm()
+        names = list(dict.fromkeys(names))
+        ids = dict((name, self.ids[name]) for name in names if name in self.ids)
+
+        missing = [name for name in names if name not in ids]
+        if missing:
+            ids.update(self._upsert(missing))
+        return ids
+
+    def resolve(self, names):
+        # Returns a `Genre` attached to the current session for each of `names`,
+        # inserting the genres that do not exist yet
+        names = list(dict.fromkeys(names))
+        ids = self.get_ids(names)
+
+        genres = []
+        for name in names:
+            # A detached `Genre` merged with load=False is attached to the session as is,
+            # without the SELECT that `Genre.query.get()` would run
+            genre = Genre(id=ids[name], name=name)
+            make_transient_to_detached(genre)
+            genres.append(db.session.merge(genre, load=False))
+        return genres
+
+    def _upsert(self, names):
+        dialect = db.engine.dialect.name
+        values = [{'name': name} for name in names]
+
+        if dialect == 'postgresql':
+            db.session.execute(postgresql.insert(Genre).values(values).on_conflict_do_nothing(index_elements=['name']))
+        elif dialect == 'sqlite':
+            db.session.execute(sqlite.insert(Genre).values(values).on_conflict_do_nothing(index_elements=['name']))
+        else:
+            db.session.execute(Genre.__table__.insert(), values)
+
+        ids = dict((name, id) for (id, name) in db.session.query(Genre.id, Genre.name).filter(Genre.name.in_(names)))
+
+        # Published to the cache by `after_commit()` below, dropped on rollback
+        db.session.info.setdefault('new_genre_ids', {}).update(ids)
+        return ids
+
+    def after_commit(self, session):
+        ids = session.info.pop('new_genre_ids', None)
+        if ids:
+            with self.lock:
+                self.ids.update(ids)
+
+    def after_rollback(self, session):
+        session.info.pop('new_genre_ids', None)
+
+
+genre_cache = GenreCache()
+
+event.listen(Session, 'after_commit', genre_cache.after_commit)
+event.listen(Session, 'after_rollback', genre_cache.after_rollback)
@@ -0,0 +1,378 @@
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from genres import genre_cache
+from rollups import count_new_shows
+from models import *
+
+### Bulk Import
+# Loads venues, artists, genres or shows from a CSV or JSON Lines file:
+#
+#   $ flask import-data venues new_york_venues.csv
+#   $ flask import-data shows shows.jsonl.gz --batch-size 10000
+#
+# Columns (CSV header / JSON keys) are the fields of the forms:
+#   venues   name, city, state, address, phone, genres, image_link, facebook_link,
+#            website, seeking_talent, seeking_description
+#   artists  name, city, state, phone, genres, image_link, facebook_link, website,
+#            seeking_venue, seeking_description
+#   shows    artist_id, venue_id, start_time ('2035-04-01 20:00:00')
+#   genres   name
+# `genres` is a JSON list, or a comma separated string in CSV. Venues and artists
+# can have an `id` column, so a shows file can refer to them.
+#
+# The file is read as a stream. Every row is validated by the form the create
+# page uses (VenueForm, ArtistForm, ShowForm) and rejected rows are reported with
+# their line number instead of failing the import. Valid rows are inserted
+# `batch_size` at a time, in one transaction per batch: with COPY on PostgreSQL
+# and executemany elsewhere. The genres of a batch are resolved in bulk by the
+# genre cache (genres.py).
+#
+# A batch failing on a constraint (e.g. an id that is already taken) is split in
+# two halves inserted on their own, and so on, until the failing rows are alone:
+# only those are rejected, the rest of the batch is imported.
+
+FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n', 'off')
+
+
+class RowError(Exception):
+    # Raised with the {field: [errors]} of a rejected row
+    pass
+
+
+class ImportReport(object):
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.read = 0
+        self.imported = 0
+        self.rejected = []  # (line number, {field: [errors]})
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return '%s: %d rows read, %d imported, %d rejected in %.2fs (%.0f rows/s)' % (
+            self.kind, self.read, self.imported, len(self.rejected), self.elapsed, self.rows_per_second)
+
+
+def open_file(path):
+    # '-' is stdin; files ending in .gz are decompressed on the fly
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def file_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(f, format):
+    # Yields (line number, dict) for every row of the file
+    if format == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield number, e
+                    continue
+                yield number, row if isinstance(row, dict) else ValueError('not a JSON object')
+
+
+def form_data(row):
+    # The row as the form data a browser would post
+    data = MultiDict()
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        if key == 'genres':
+            names = value if isinstance(value, list) else value.split(',')
+            for name in names:
+                if name.strip():
+                    data.add(key, name.strip())
+        elif key.startswith('seeking_') and key != 'seeking_description':
+            # BooleanField is true for anything posted, so only post true values
+            if str(value).strip().lower() not in FALSE_VALUES:
+                data.add(key, 'y')
+        else:
+            data.add(key, str(value).strip())
+    return data
+
+
+### Loaders
+# One per kind of row: `validate()` turns a row into the values to insert (or
+# raises RowError with the form errors), `insert()` writes a batch of them.
+
+class Loader(object):
+    form_class = None
+
+    def __init__(self):
+        # One form, refilled for every row: binding the fields of a new form costs more than validating it
+        self.form = self.form_class(formdata=None, meta={'csrf': False}) if self.form_class else None
+
+    def validate(self, row):
+        form = self.form
+        form.process(form_data(row))
+        if not form.validate():
+            raise RowError(form.errors)
+        return self.values(form, row)
+
+    def values(self, form, row):
+        raise NotImplementedError
+
+    def insert(self, batch):
+        raise NotImplementedError
+
+
+class PerformerLoader(Loader):
+    # Venues and artists: the row, its genres, and rows of the genre association table
+    model = None
+    genres_table = None
+    key = None
+    fields = ()
+
+    def values(self, form, row):
+        values = dict((field, getattr(form, field).data) for field in self.fields)
+        if row.get('id') not in (None, ''):
+            try:
+                values['id'] = int(row['id'])
+            except ValueError:
+                raise RowError({'id': ['Not an integer']})
+        return values, form.genres.data
+
+    def insert(self, batch):
+        table = self.model.__table__
+        explicit = [values['id'] for values, _ in batch if 'id' in values]
+        if explicit and len(explicit) != len(batch):
+            raise RowError({'id': ['Either every row or no row of a file can have an id']})
+        ids = explicit or allocate_ids(table, len(batch))
+
+        genre_ids = genre_cache.get_ids(name for _, names in batch for name in names)
+        now = datetime.utcnow()
+        rows = []
+        links = []
+        for id, (values, names) in zip(ids, batch):
+            # Copied: a batch that fails is inserted again in halves, with ids allocated again
+            rows.append(dict(values, id=id, updated_at=now))
+            links.extend({'genre_id': genre_ids[name], self.key: id} for name in dict.fromkeys(names))
+
+        insert_rows(table, ('id',) + self.fields + ('updated_at',), rows)
+        insert_rows(self.genres_table, ('genre_id', self.key), links)
+        if explicit:
+            sync_sequence(table)
+
+
+class VenueLoader(PerformerLoader):
+    form_class = VenueForm
+    model = Venue
+    genres_table = genres_venues
+    key = 'venue_id'
+    fields = ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link', 'website',
+        'seeking_talent', 'seeking_description')
+
+
+class ArtistLoader(PerformerLoader):
+    form_class = ArtistForm
+    model = Artist
+    genres_table = genres_artists
+    key = 'artist_id'
+    fields = ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'website',
+        'seeking_venue', 'seeking_description')
+
+
+class ShowLoader(Loader):
+    form_class = ShowForm
+
+    def values(self, form, row):
+        errors = {}
+        values = {'start_time': form.start_time.data}
+        for field in ('artist_id', 'venue_id'):
+            try:
+                values[field] = int(getattr(form, field).data)
+            except ValueError:
+                errors[field] = ['Not an integer']
+        if errors:
+            raise RowError(errors)
+        return values
+
+    def missing_references(self, batch):
+        # Rows of `batch` whose venue or artist does not exist, as {index: errors}
+        venue_ids = set(id for (id,) in db.session.query(Venue.id).filter(Venue.id.in_(set(v['venue_id'] for v in batch))))
+        artist_ids = set(id for (id,) in db.session.query(Artist.id).filter(Artist.id.in_(set(v['artist_id'] for v in batch))))
+        missing = {}
+        for index, values in enumerate(batch):
+            errors = {}
+            if values['venue_id'] not in venue_ids:
+                errors['venue_id'] = ['No venue with id %d' % values['venue_id']]
+            if values['artist_id'] not in artist_ids:
+                errors['artist_id'] = ['No artist with id %d' % values['artist_id']]
+            if errors:
+                missing[index] = errors
+        return missing
+
+    def insert(self, batch):
+        now = datetime.utcnow()
+        rows = [dict(values, updated_at=now) for values in batch]
+        insert_rows(Show.__table__, ('artist_id', 'venue_id', 'start_time', 'updated_at'), rows)
+        count_new_shows((values['venue_id'], values['artist_id'], values['start_time']) for values in batch)
+
+
+class GenreLoader(Loader):
+    # Genre names, restricted to the choices of the forms
+    choices = set(value for value, _ in VenueForm.genres.kwargs['choices'])
+
+    def validate(self, row):
+        name = (row.get('name') or '').strip()
+        if name not in self.choices:
+            raise RowError({'name': ['%r is not a valid genre' % name]})
+        return name
+
+    def insert(self, batch):
+        genre_cache.get_ids(batch)
+
+
+LOADERS = {
+    'venues': VenueLoader,
+    'artists': ArtistLoader,
+    'shows': ShowLoader,
+    'genres': GenreLoader,
+}
+
+
+### Writing
+
+def dialect():
+    return db.engine.dialect.name
+
+
+def allocate_ids(table, count):
+    # Primary keys for `count` new rows of `table`, so the genre association rows can refer to them
+    if dialect() == 'postgresql':
+        rows = db.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {'table': '"%s"' % table.name, 'count': count})
+        return [id for (id,) in rows]
+    # Elsewhere (SQLite) writers are serialized, so the ids after the current maximum are free
+    start = db.session.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+    return list(range(start + 1, start + count + 1))
+
+
+def sync_sequence(table):
+    # After inserting explicit ids, moves the id sequence past them
+    if dialect() == 'postgresql':
+        db.session.execute(text("SELECT setval(pg_get_serial_sequence(:table, 'id'), (SELECT max(id) FROM \"%s\"))"
+            % table.name), {'table': '"%s"' % table.name})
+
+
+def insert_rows(table, columns, rows):
+    if not rows:
+        return
+    if dialect() == 'postgresql':
+        copy_rows(table, columns, rows)
+    else:
+        db.session.execute(table.insert(), [dict((column, row[column]) for column in columns) for row in rows])
+
+
+def copy_rows(table, columns, rows):
+    # COPY ... FROM STDIN through the session's connection, so it is part of the batch's transaction
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+
+    statement = 'COPY "%s" (%s) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')' % (table.name, ', '.join(columns))
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    except db.engine.dialect.dbapi.IntegrityError as e:
+        # Raised by the driver itself: wrapped as SQLAlchemy wraps it for the statements it runs
+        raise IntegrityError(statement, None, e)
+    finally:
+        cursor.close()
+
+
+### Import
+
+def import_file(kind, path, format=None, batch_size=5000, dry_run=False):
+    # Imports the rows of `path` and returns an `ImportReport`
+    loader = LOADERS[kind]()
+    report = ImportReport(kind)
+    genre_cache.warm()
+    batch = []
+    lines = []
+
+    def insert(rows, rows_lines):
+        # Inserts `rows` in one transaction and returns how many were. On a constraint violation, the
+        # halves of `rows` are inserted on their own, and only the rows failing alone are rejected
+        try:
+            loader.insert(rows)
+            db.session.commit()
+            return len(rows)
+        except (RowError, IntegrityError) as e:
+            db.session.rollback()
+            if isinstance(e, IntegrityError) and len(rows) > 1:
+                half = len(rows) // 2
+                return insert(rows[:half], rows_lines[:half]) + insert(rows[half:], rows_lines[half:])
+            errors = e.args[0] if isinstance(e, RowError) else {'row': [str(e.orig)]}
+            report.rejected.extend((line, errors) for line in rows_lines)
+            return 0
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def flush():
+        if isinstance(loader, ShowLoader):
+            missing = loader.missing_references(batch)
+            for index in sorted(missing):
+                report.rejected.append((lines[index], missing[index]))
+            valid = [values for index, values in enumerate(batch) if index not in missing]
+            valid_lines = [line for index, line in enumerate(lines) if index not in missing]
+        else:
+            valid = list(batch)
+            valid_lines = list(lines)
+
+        if valid and not dry_run:
+            report.imported += insert(valid, valid_lines)
+        else:
+            report.imported += len(valid)
+        del batch[:]
+        del lines[:]
+
+    with open_file(path) as f:
+        for line, row in read_rows(f, format or file_format(path)):
+            report.read += 1
+            if isinstance(row, Exception):
+                report.rejected.append((line, {'row': [str(row)]}))
+                continue
+            try:
+                batch.append(loader.validate(row))
+                lines.append(line)
+            except RowError as e:
+                report.rejected.append((line, e.args[0]))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+    report.elapsed = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,351 @@
+import glob
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request, has_request_context, before_render_template, template_rendered, abort, Response
+from sqlalchemy import event
+
+### Request Metrics
+# Records, for every request: the number of SQL statements, the time spent in
+# the database, the slowest statement and the time spent rendering templates.
+#
+# The numbers are aggregated per endpoint into histograms, served in the
+# Prometheus text format at /metrics:
+#   fyyur_request_duration_seconds{endpoint="venues"}   wall time of the request
+#   fyyur_request_queries{endpoint="venues"}            SQL statements per request
+#   fyyur_request_sql_seconds{endpoint="venues"}        time spent in the database
+#   fyyur_request_template_seconds{endpoint="venues"}   time spent rendering templates
+#
+# and, for the responses compression.py compresses, counters of their size and
+# of the bytes compression saved:
+#   fyyur_compression_input_bytes_total{endpoint="venues"}
+#   fyyur_compression_saved_bytes_total{endpoint="venues"}
+#
+# Statements slower than SLOW_QUERY_THRESHOLD_MS are written to the
+# 'fyyur.slow_queries' logger (and to SLOW_QUERY_LOG, if set) with the view
+# that ran them. Each request's numbers and slowest statement are logged to
+# 'fyyur.requests' at DEBUG level.
+#
+# /metrics is only served with METRICS_TOKEN set, to the requests sending it as
+# `Authorization: Bearer <token>` (`bearer_token` in the Prometheus scrape config).
+#
+# The numbers are kept in each process. Under several workers (gunicorn, uvicorn
+# --workers), a scrape is answered by one of them: set METRICS_DIR to a directory
+# shared by the workers of the host, and each one writes its numbers there (at most
+# every METRICS_FLUSH_INTERVAL seconds, after a request), and /metrics serves the
+# sum of them. The numbers of a worker that exited stay in the sum, as counters
+# must; empty the directory when the app is (re)deployed, before the workers start.
+# Without METRICS_DIR, /metrics is only right with a single worker.
+#
+# METRICS_ENABLED = False (config.py) leaves the engine and the app untouched.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+slow_query_logger = logging.getLogger('fyyur.slow_queries')
+request_logger = logging.getLogger('fyyur.requests')
+
+
+def app_engines(app, db):
+    # The primary engine and the engines of SQLALCHEMY_BINDS (e.g. the read replicas)
+    return [db.get_engine(app)] + [db.get_engine(app, bind=bind) for bind in app.config.get('SQLALCHEMY_BINDS') or ()]
+
+
+class Histogram(object):
+    # Cumulative histogram with fixed upper bounds, one series per label value
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}  # label -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            series = self.series.get(label)
+            if series is None:
+                series = self.series[label] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return dict((label, list(values)) for label, values in self.series.items())
+
+    @staticmethod
+    def merge(total, series):
+        for label, values in series.items():
+            if label in total:
+                total[label] = [a + b for a, b in zip(total[label], values)]
+            else:
+                total[label] = list(values)
+
+    def render(self, label_name, series=None):
+        # `series`: the merged snapshots of the workers, this process' own series by default
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        series = sorted((series if series is not None else self.snapshot()).items())
+        for label, values in series:
+            label = label.replace('\\', '\\\\').replace('"', '\\"')
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                total += count
+                lines.append('%s_bucket{%s="%s",le="%s"} %d' % (self.name, label_name, label, bound, total))
+            lines.append('%s_sum{%s="%s"} %r' % (self.name, label_name, label, values[-1]))
+            lines.append('%s_count{%s="%s"} %d' % (self.name, label_name, label, total))
+        return lines
+
+
+class Counter(object):
+    # Counter, one series per label value
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}  # label -> total
+        self.lock = threading.Lock()
+
+    def inc(self, label, value=1):
+        with self.lock:
+            self.series[label] = self.series.get(label, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.series)
+
+    @staticmethod
+    def merge(total, series):
+        for label, value in series.items():
+            total[label] = total.get(label, 0) + value
+
+    def render(self, label_name, series=None):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        series = sorted((series if series is not None else self.snapshot()).items())
+        for label, value in series:
+            label = label.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append('%s{%s="%s"} %d' % (self.name, label_name, label, value))
+        return lines
+
+
+class RequestMetrics(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_query_threshold = 0.5
+        self.duration = Histogram('fyyur_request_duration_seconds', 'Wall time of the request.', DURATION_BUCKETS)
+        self.queries = Histogram('fyyur_request_queries', 'SQL statements executed by the request.', QUERY_BUCKETS)
+        self.sql_time = Histogram('fyyur_request_sql_seconds', 'Time the request spent in the database.', DURATION_BUCKETS)
+        self.template_time = Histogram('fyyur_request_template_seconds', 'Time the request spent rendering templates.', DURATION_BUCKETS)
+        self.compressed_bytes = Counter('fyyur_compression_input_bytes_total', 'Bytes of the responses compressed, before compression.')
+        self.saved_bytes = Counter('fyyur_compression_saved_bytes_total', 'Bytes compression took off the responses.')
+        self.slow_queries = 0
+        self.token = None
+        self.directory = None
+        self.flush_interval = 1.0
+        self.flushed_at = 0.0
+        self.flush_lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+        self.slow_query_threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', 500) / 1000.0
+        self.token = app.config.get('METRICS_TOKEN')
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 1.0)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        log_file = app.config.get('SLOW_QUERY_LOG')
+        if log_file:
+            handler = logging.FileHandler(log_file)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.WARNING)
+
+        for engine in app_engines(app, db):
+            self.instrument_engine(engine)
+        before_render_template.connect(self._before_render_template, app)
+        template_rendered.connect(self._template_rendered, app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if self.token:
+            app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    # SQL statements
+
+    def instrument_engine(self, engine):
+        # Records the statements of `engine`. Also called for the async engines of asgi.py,
+        # with their `sync_engine`
+        if not self.enabled:
+            return
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        endpoint = None
+
+        if has_request_context() and 'metrics' in g:
+            current = g.metrics
+            current['queries'] += 1
+            current['sql_time'] += elapsed
+            if elapsed > current['slowest_time']:
+                current['slowest_time'] = elapsed
+                current['slowest'] = statement
+            endpoint = request.endpoint
+
+        if elapsed >= self.slow_query_threshold:
+            self.slow_queries += 1
+            slow_query_logger.warning('%.1fms in %s: %s', elapsed * 1000, endpoint or '-', ' '.join(statement.split()))
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute
+        started = context.connection.info.get('metrics_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    # Templates
+
+    def _before_render_template(self, app, template, context, **extra):
+        if 'metrics' in g:
+            g.metrics['template_started'].append(time.perf_counter())
+
+    def _template_rendered(self, app, template, context, **extra):
+        # Nested renders (e.g. an error page) are counted once, by the outermost template
+        if 'metrics' in g and g.metrics['template_started']:
+            started = g.metrics['template_started'].pop()
+            if not g.metrics['template_started']:
+                g.metrics['template_time'] += time.perf_counter() - started
+
+    # Requests
+
+    def _before_request(self):
+        g.metrics = {
+            'started': time.perf_counter(),
+            'queries': 0,
+            'sql_time': 0.0,
+            'slowest': None,
+            'slowest_time': 0.0,
+            'template_started': [],
+            'template_time': 0.0,
+        }
+
+    def _after_request(self, response):
+        # Streamed responses are recorded once they are closed, so the queries run while streaming are included
+        current = g.get('metrics')
+        if current is not None and response.is_streamed:
+            current['deferred'] = True
+            endpoint = request.endpoint
+            response.call_on_close(lambda: self._record(endpoint, current))
+        return response
+
+    def _teardown_request(self, exc):
+        current = g.get('metrics')
+        if current is not None and not current.get('deferred'):
+            self._record(request.endpoint, current)
+
+    def _record(self, endpoint, current):
+        endpoint = endpoint or 'unknown'
+        duration = time.perf_counter() - current['started']
+
+        self.duration.observe(endpoint, duration)
+        self.queries.observe(endpoint, current['queries'])
+        self.sql_time.observe(endpoint, current['sql_time'])
+        self.template_time.observe(endpoint, current['template_time'])
+
+        request_logger.debug('%s %.1fms: %d queries in %.1fms, templates %.1fms, slowest %.1fms: %s',
+            endpoint, duration * 1000, current['queries'], current['sql_time'] * 1000,
+            current['template_time'] * 1000, current['slowest_time'] * 1000, current['slowest'])
+        self.flush_soon()
+
+    # Response compression (compression.py)
+
+    def record_compression(self, endpoint, size, compressed_size):
+        if self.enabled:
+            self.compressed_bytes.inc(endpoint or 'unknown', size)
+            self.saved_bytes.inc(endpoint or 'unknown', size - compressed_size)
+
+    # Workers (METRICS_DIR)
+
+    def metrics(self):
+        # name -> histogram/counter
+        return dict((metric.name, metric) for metric in (self.duration, self.queries, self.sql_time,
+            self.template_time, self.compressed_bytes, self.saved_bytes))
+
+    def snapshot(self):
+        # This process' numbers, as written to METRICS_DIR
+        snapshot = dict((name, metric.snapshot()) for name, metric in self.metrics().items())
+        snapshot['slow_queries'] = self.slow_queries
+        return snapshot
+
+    def worker_file(self, pid=None):
+        return os.path.join(self.directory, 'worker-%d.json' % (pid or os.getpid()))
+
+    def flush_soon(self):
+        # Writes this process' numbers to METRICS_DIR, unless they were written less than
+        # METRICS_FLUSH_INTERVAL seconds ago or another thread is writing them
+        if not self.directory or time.time() < self.flushed_at + self.flush_interval:
+            return
+        if not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            self.flushed_at = time.time()
+            self.flush()
+        finally:
+            self.flush_lock.release()
+
+    def flush(self):
+        # Replaced whole, so a scrape never reads a half-written file
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix='.worker-', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path, self.worker_file())
+
+    def worker_snapshots(self):
+        # The numbers of the other workers of METRICS_DIR, and of this process
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = self.worker_file()
+            for path in glob.glob(os.path.join(self.directory, 'worker-*.json')):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    # Removed, or being replaced, since the glob
+                    continue
+        return snapshots
+
+    def render(self):
+        snapshots = self.worker_snapshots()
+        lines = []
+        for name, metric in self.metrics().items():
+            series = {}
+            for snapshot in snapshots:
+                metric.merge(series, snapshot.get(name, {}))
+            lines.extend(metric.render('endpoint', series))
+        lines.append('# HELP fyyur_slow_queries_total Statements slower than the slow query threshold.')
+        lines.append('# TYPE fyyur_slow_queries_total counter')
+        lines.append('fyyur_slow_queries_total %d' % sum(snapshot.get('slow_queries', 0) for snapshot in snapshots))
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode('utf-8'), ('Bearer ' + self.token).encode('utf-8')):
+            abort(401)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+request_metrics = RequestMetrics()
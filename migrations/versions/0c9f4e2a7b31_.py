@@ -0,0 +1,50 @@
+"""indexes on Show.venue_id, Show.artist_id and Show.start_time
+
+Revision ID: 0c9f4e2a7b31
+Revises: 2eba390c22ee
+Create Date: 2026-10-18 18:02:37.551204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c9f4e2a7b31'
+down_revision = '2eba390c22ee'
+branch_labels = None
+depends_on = None
+
+# The foreign key indexes lead with the key and carry start_time, so a venue's or
+# an artist's shows are read in start time order without a sort.
+INDEXES = (
+    ('ix_Show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_Show_start_time', ['start_time']),
+)
+
+
+def upgrade():
+    # On PostgreSQL the indexes are built CONCURRENTLY, so shows can still be created while
+    # a large table is indexed. That can't run in a transaction, hence the autocommit block.
+    # A concurrent build that fails leaves an INVALID index behind: drop it and run again.
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, columns in INDEXES:
+                op.create_index(name, 'Show', columns, unique=False,
+                    postgresql_concurrently=True, if_not_exists=True)
+        return
+
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns, unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, _ in reversed(INDEXES):
+                op.drop_index(name, table_name='Show', postgresql_concurrently=True, if_exists=True)
+        return
+
+    for name, _ in reversed(INDEXES):
+        op.drop_index(name, table_name='Show')
@@ -0,0 +1,47 @@
+"""updated_at on Venue, Artist and Show
+
+Revision ID: 2eba390c22ee
+Revises: 892b573ac5fa
+Create Date: 2026-10-18 17:20:12.318906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2eba390c22ee'
+down_revision = '892b573ac5fa'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def utc_now():
+    # The current time in UTC, as the app writes `updated_at` (datetime.utcnow()): PostgreSQL's
+    # CURRENT_TIMESTAMP is in the session's time zone, SQLite's is UTC
+    if op.get_bind().dialect.name == 'postgresql':
+        return "timezone('utc', now())"
+    return 'CURRENT_TIMESTAMP'
+
+
+def upgrade():
+    # Existing rows count as changed now. SQLite can't add a NOT NULL column with a
+    # CURRENT_TIMESTAMP default, so the column is filled first and constrained after
+    # (batch mode rebuilds the table on SQLite, and is a plain ALTER on PostgreSQL).
+    now = utc_now()
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(f'UPDATE "{table}" SET updated_at = {now}')
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False,
+                server_default=sa.text(now))
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,48 @@
+"""upcoming/past show counts on Venue and Artist
+
+Revision ID: 5d1e8c3f9a60
+Revises: 0c9f4e2a7b31
+Create Date: 2026-10-18 18:41:09.273645
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1e8c3f9a60'
+down_revision = '0c9f4e2a7b31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Rollup',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('rolled_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # The counts as of now, which becomes the watermark of `flask roll-show-counts` (see rollups.py).
+    # The app compares start times with the local time (datetime.now()), so the database clock isn't used
+    now = datetime.now()
+    for table, column in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.get_bind().execute(sa.text(f'''
+            UPDATE "{table}" SET
+                upcoming_shows_count = (SELECT COUNT(*) FROM "Show" WHERE "Show".{column} = "{table}".id AND start_time > :now),
+                past_shows_count = (SELECT COUNT(*) FROM "Show" WHERE "Show".{column} = "{table}".id AND start_time <= :now)
+        '''), {'now': now})
+    op.get_bind().execute(sa.text('INSERT INTO "Rollup" (name, rolled_at) VALUES (\'show_counts\', :now)'), {'now': now})
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
+    op.drop_table('Rollup')
@@ -0,0 +1,46 @@
+"""unique index on Genre.name
+
+Revision ID: 892b573ac5fa
+Revises: df8a04d05c44
+Create Date: 2026-10-18 11:24:51.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '892b573ac5fa'
+down_revision = 'df8a04d05c44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Concurrent submissions could insert the same genre twice. Before the unique
+    # index can be created, point every venue/artist at the oldest row of each
+    # genre name and delete the duplicates.
+    for table, column in (('genres_venues', 'venue_id'), ('genres_artists', 'artist_id')):
+        op.execute(f'''
+            INSERT INTO {table} (genre_id, {column})
+            SELECT DISTINCT keep.id, link.{column}
+            FROM {table} link
+            JOIN "Genre" genre ON genre.id = link.genre_id
+            JOIN (SELECT name, MIN(id) AS id FROM "Genre" GROUP BY name) keep ON keep.name = genre.name
+            WHERE keep.id <> genre.id
+            AND NOT EXISTS (
+                SELECT 1 FROM {table} existing
+                WHERE existing.genre_id = keep.id AND existing.{column} = link.{column}
+            )
+        ''')
+        op.execute(f'''
+            DELETE FROM {table}
+            WHERE genre_id NOT IN (SELECT MIN(id) FROM "Genre" GROUP BY name)
+        ''')
+    op.execute('DELETE FROM "Genre" WHERE id NOT IN (SELECT MIN(id) FROM "Genre" GROUP BY name)')
+
+    op.create_index(op.f('ix_Genre_name'), 'Genre', ['name'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Genre_name'), table_name='Genre')
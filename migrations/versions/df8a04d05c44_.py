@@ -0,0 +1,38 @@
+"""trigram indexes on Venue.name and Artist.name
+
+Revision ID: df8a04d05c44
+Revises: ec10e6e19540
+Create Date: 2026-10-18 10:02:13.518220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'df8a04d05c44'
+down_revision = 'ec10e6e19540'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm GIN indexes let `name ILIKE '%term%'` and `similarity(name, term)`
+    # use an index instead of scanning the whole table.
+    # Other databases have no trigram indexes, see search.py for the fallback.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
@@ -1,5 +1,24 @@
-from app import db
+from extensions import db
 from datetime import datetime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+### UTC Timestamps
+# The app writes `updated_at` as `datetime.utcnow()`, so the rows the database
+# stamps itself (server_default) have to be UTC too: CURRENT_TIMESTAMP is UTC on
+# SQLite, but PostgreSQL's now() is in the session's time zone.
+
+class utcnow(FunctionElement):
+    type = db.DateTime()
+    inherit_cache = True
+
+@compiles(utcnow)
+def compile_utcnow(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+@compiles(utcnow, 'postgresql')
+def compile_utcnow_postgresql(element, compiler, **kw):
+    return "timezone('utc', now())"
 
 ### Association Table Declaration
 
@@ -19,7 +38,8 @@ class Genre(db.Model):
   __tablename__ = "Genre"
   
   id = db.Column(db.Integer, primary_key=True)
-  name = db.Column(db.String(), nullable=False)
+  # Unique, so concurrent submissions can't insert the same genre twice (see genres.py)
+  name = db.Column(db.String(), nullable=False, unique=True, index=True)
 
   def __repr__(self):
       return f'<ID: {self.id}, NAME: {self.name}'
@@ -39,6 +59,12 @@ class Venue(db.Model):
     website = db.Column(db.String())
     seeking_talent = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String())
+    # Last change of the row, for incremental exports (see exporter.py)
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow,
+      server_default=utcnow(), nullable=False, index=True)
+    # Numbers of upcoming and past shows, maintained by rollups.py
+    upcoming_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    past_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
   
     # 'genres' describes many to many relationship between Venue-(Parent) and Genre-(Child) by an association table `genres_venues`
     genres = db.relationship('Genre', secondary=genres_venues, backref=db.backref('venues'), lazy=True)
@@ -69,6 +95,12 @@ class Artist(db.Model):
     website = db.Column(db.String())
     seeking_venue = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String())
+    # Last change of the row, for incremental exports (see exporter.py)
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow,
+      server_default=utcnow(), nullable=False, index=True)
+    # Numbers of upcoming and past shows, maintained by rollups.py
+    upcoming_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    past_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     # 'genres' describes many to many relationship between Artist-(Parent) and Genre-(Child) by an association table `genres_artists`
     genres = db.relationship('Genre', secondary=genres_artists, backref=db.backref('artists'), lazy=True)
@@ -91,12 +123,32 @@ class Artist(db.Model):
 
 class Show(db.Model):
   __tablename__ = 'Show'
+  # The venue and artist pages read one venue's/artist's shows by start time, /shows pages through
+  # all shows by start time. Created concurrently on PostgreSQL, see migration 0c9f4e2a7b31
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
-  start_time = db.Column(db.DateTime(), default=datetime.utcnow, nullable=False)
+  start_time = db.Column(db.DateTime(), default=datetime.utcnow, nullable=False, index=True)
   
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'),  nullable=False)
+  # Last change of the row, for incremental exports (see exporter.py)
+  updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow,
+    server_default=utcnow(), nullable=False, index=True)
   
   def __repr__(self):
-      return f'<ID: {self.id}, START TIME: {self.start_time}, ARTIST ID: {self.artist_id}, VENUE ID: {self.venue_id}'
\ No newline at end of file
+      return f'<ID: {self.id}, START TIME: {self.start_time}, ARTIST ID: {self.artist_id}, VENUE ID: {self.venue_id}'
+
+
+class Rollup(db.Model):
+  # The time up to which a rollup has been brought, see rollups.py
+  __tablename__ = 'Rollup'
+
+  name = db.Column(db.String(), primary_key=True)
+  rolled_at = db.Column(db.DateTime(), nullable=False)
+
+  def __repr__(self):
+      return f'<NAME: {self.name}, ROLLED AT: {self.rolled_at}'
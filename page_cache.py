@@ -0,0 +1,275 @@
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, session, make_response, Response
+from replicas import STICKY_COOKIE
+
+### Rendered Page Cache
+# Caches the rendered HTML of the read-heavy pages (/venues, /artists, /shows,
+# /venues/<id>, /artists/<id>), keyed by route, view arguments and query string.
+#
+# Every cached page is tagged with what it shows, e.g. /venues/3 -> 'venue:3'.
+# Each tag has a version, and the versions of a page's tags are part of its key.
+# Invalidating a tag gives it a new version, so every page showing it misses the
+# cache from then on (the stale entries are evicted in their own time).
+# The create/edit submissions invalidate exactly the tags their commit affected.
+#
+# Entries also expire after PAGE_CACHE_TIMEOUT seconds, because shows move from
+# "upcoming" to "past" without anything being written.
+#
+# Under @conditional_requests.conditional (conditional.py), the page's ETag is
+# part of its key too: the validator read for the request moves when a show
+# starts or when another worker commits an edit (whose invalidation this
+# worker's LRU never sees), so the page is rendered again instead of an entry
+# older than the ETag it would be sent with.
+#
+# PAGE_CACHE_BACKEND (config.py):
+#   None         - caching disabled
+#   'lru'        - in-process LRU of PAGE_CACHE_MAX_ENTRIES pages, one per worker
+#   'filesystem' - files under PAGE_CACHE_DIR, shared by every worker on the host
+
+class LRUBackend(object):
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires, value)
+        self.tags = {}                # tag -> version
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.time() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_tag_versions(self, tags):
+        with self.lock:
+            return [self.tags.get(tag, '0') for tag in tags]
+
+    def invalidate_tag(self, tag):
+        with self.lock:
+            self.tags[tag] = os.urandom(8).hex()
+
+    def size(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+
+
+class FileSystemBackend(object):
+    # Entries are pickled to <directory>/entries/<key>, tag versions are written to
+    # <directory>/tags/<tag>. Files are replaced atomically, so several worker
+    # processes can share the directory.
+
+    def __init__(self, directory, max_entries=10000, check_every=64):
+        self.entries_dir = os.path.join(directory, 'entries')
+        self.tags_dir = os.path.join(directory, 'tags')
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.tags_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self.check_every = check_every
+        self.sets = 0
+        self.evictions = 0
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        path = os.path.join(self.entries_dir, key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time.time():
+            self._remove(path)
+            return None
+        return value
+
+    def set(self, key, value, timeout):
+        self._write(os.path.join(self.entries_dir, key), pickle.dumps((time.time() + timeout, value)))
+        self.sets += 1
+        if self.sets % self.check_every == 0:
+            self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        # Removes the least recently written entries once there are more than `max_entries`
+        names = os.listdir(self.entries_dir)
+        if len(names) <= self.max_entries:
+            return
+        paths = []
+        for name in names:
+            path = os.path.join(self.entries_dir, name)
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        paths.sort()
+        for _, path in paths[:len(paths) - int(self.max_entries * 0.9)]:
+            self._remove(path)
+            self.evictions += 1
+
+    def _tag_path(self, tag):
+        return os.path.join(self.tags_dir, tag.replace(':', '-').replace('/', '-'))
+
+    def get_tag_versions(self, tags):
+        versions = []
+        for tag in tags:
+            try:
+                with open(self._tag_path(tag)) as f:
+                    versions.append(f.read())
+            except OSError:
+                versions.append('0')
+        return versions
+
+    def invalidate_tag(self, tag):
+        self._write(self._tag_path(tag), os.urandom(8).hex().encode('ascii'))
+
+    def size(self):
+        return len(os.listdir(self.entries_dir))
+
+    def clear(self):
+        for directory in (self.entries_dir, self.tags_dir):
+            for name in os.listdir(directory):
+                self._remove(os.path.join(directory, name))
+
+
+class PageCache(object):
+
+    def __init__(self):
+        self.backend = None
+        self.timeout = 300
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        backend = app.config.get('PAGE_CACHE_BACKEND')
+        max_entries = app.config.get('PAGE_CACHE_MAX_ENTRIES', 1000)
+        self.timeout = app.config.get('PAGE_CACHE_TIMEOUT', 300)
+
+        if backend == 'lru':
+            self.backend = LRUBackend(max_entries)
+        elif backend == 'filesystem':
+            self.backend = FileSystemBackend(app.config['PAGE_CACHE_DIR'], max_entries)
+        elif backend is None:
+            self.backend = None
+        else:
+            raise ValueError('Unknown PAGE_CACHE_BACKEND %r' % backend)
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def cached(self, *tags):
+        # Caches the view's response, tagged with `tags`. Tags can refer to the
+        # view arguments, e.g. @page_cache.cached('venue:{venue_id}').
+        # The view can be a coroutine (see async_views.py)
+        def decorator(view):
+            if inspect.iscoroutinefunction(view):
+                @wraps(view)
+                async def async_wrapper(**kwargs):
+                    key = self.page_key(tags, kwargs)
+                    if key is None:
+                        return await view(**kwargs)
+                    response = self.lookup(key)
+                    if response is None:
+                        response = self.store(key, await view(**kwargs))
+                    return response
+                return async_wrapper
+
+            @wraps(view)
+            def wrapper(**kwargs):
+                key = self.page_key(tags, kwargs)
+                if key is None:
+                    return view(**kwargs)
+                response = self.lookup(key)
+                if response is None:
+                    response = self.store(key, view(**kwargs))
+                return response
+            return wrapper
+        return decorator
+
+    def page_key(self, tags, kwargs):
+        # The cache key of the page the request asks for, or None when it is not served from the cache.
+        # Pages carrying flashed messages are rendered for one user only, and
+        # browsers reading their own writes (see replicas.py) get a fresh page
+        if not self.enabled or request.method != 'GET' or session.get('_flashes') \
+                or request.cookies.get(STICKY_COOKIE):
+            return None
+        return self.make_key([tag.format(**kwargs) for tag in tags])
+
+    def lookup(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        body, mimetype = entry
+        return Response(body, mimetype=mimetype)
+
+    def store(self, key, rv):
+        # The view's return value as a response, cached when it is a complete page
+        response = make_response(rv)
+        if response.status_code == 200 and not response.is_streamed:
+            self.backend.set(key, (response.get_data(), response.mimetype), self.timeout)
+        return response
+
+    def make_key(self, tags):
+        versions = self.backend.get_tag_versions(tags)
+        parts = [request.endpoint, request.full_path] + ['%s=%s' % tag for tag in zip(tags, versions)]
+        # The ETag the response will carry, see conditional.py
+        parts.append(g.get('page_etag') or '')
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def invalidate(self, *tags):
+        if not self.enabled:
+            return
+        for tag in tags:
+            self.backend.invalidate_tag(tag)
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'entries': self.backend.size() if self.backend else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions if self.backend else 0,
+            'invalidations': self.invalidations,
+        }
+
+
+page_cache = PageCache()
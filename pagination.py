@@ -0,0 +1,125 @@
+import base64
+import json
+from datetime import datetime
+from flask import request, current_app, abort
+from sqlalchemy import tuple_, DateTime
+
+### Keyset Pagination
+# Pages through a query by remembering the sort key of the last (or first) row
+# shown, instead of an OFFSET. Fetching page 1000 costs the same as page 1:
+# the database seeks straight to `WHERE (start_time, id) < (:last_start_time, :last_id)`
+# and reads `per_page + 1` rows (the extra row tells us whether there is a next page).
+#
+# The sort key has to be unique, so it always ends with the primary key,
+# e.g. (Show.start_time, Show.id) or (Artist.name, Artist.id).
+#
+# Cursors are the sort key of a row, as url-safe base64 JSON:
+#   /shows?after=<cursor of the last show on this page>    -> next page
+#   /shows?before=<cursor of the first show on this page>  -> previous page
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, columns):
+    # Returns the sort key values stored in `cursor`, typed like `columns`.
+    # Raises ValueError for cursors that were not made by `encode_cursor()`
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+
+    decoded = []
+    for column, value in zip(columns, values):
+        if isinstance(column.type, DateTime) and value is not None:
+            value = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+        decoded.append(value)
+    return decoded
+
+
+class KeysetPage(object):
+
+    def __init__(self, items, per_page, next_cursor, prev_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_query(query, columns, after=None, before=None, per_page=50, descending=False):
+    # `query` past the `after`/`before` cursor, ordered by `columns` and limited to `per_page + 1` rows.
+    # Works on a Query and on a select(). Raises ValueError for an invalid cursor
+    key = tuple_(*columns)
+    backwards = before is not None
+
+    if after is not None:
+        values = tuple_(*decode_cursor(after, columns))
+        query = query.filter(key < values if descending else key > values)
+    elif before is not None:
+        values = tuple_(*decode_cursor(before, columns))
+        query = query.filter(key > values if descending else key < values)
+
+    # When walking backwards the rows are read in reverse and flipped afterwards
+    if descending != backwards:
+        query = query.order_by(*[column.desc() for column in columns])
+    else:
+        query = query.order_by(*[column.asc() for column in columns])
+
+    return query.limit(per_page + 1)
+
+
+def keyset_page(rows, columns, after=None, before=None, per_page=50):
+    # The `KeysetPage` of the rows read from `keyset_query()` with the same arguments
+    backwards = before is not None
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor(row):
+        return encode_cursor([getattr(row, column.key) for column in columns])
+
+    if backwards:
+        next_cursor = cursor(rows[-1]) if rows else None
+        prev_cursor = cursor(rows[0]) if rows and more else None
+    else:
+        next_cursor = cursor(rows[-1]) if rows and more else None
+        prev_cursor = cursor(rows[0]) if rows and after is not None else None
+
+    return KeysetPage(rows, per_page, next_cursor, prev_cursor)
+
+
+def keyset_paginate(query, columns, after=None, before=None, per_page=50, descending=False):
+    # Returns a `KeysetPage` of `query` ordered by `columns`.
+    # The rows of `query` must include the values of `columns` as attributes
+    # with the same names, e.g. `row.start_time` and `row.id` for (Show.start_time, Show.id)
+    rows = keyset_query(query, columns, after, before, per_page, descending).all()
+    return keyset_page(rows, columns, after, before, per_page)
+
+
+def page_request_args():
+    # The cursor and page size of the request, as keyword arguments of `keyset_paginate()`:
+    # ?after=<cursor> / ?before=<cursor> and ?per_page=<n>, capped at MAX_PAGE_SIZE
+    per_page = request.args.get('per_page', current_app.config.get('PAGE_SIZE', 50), type=int)
+    per_page = max(1, min(per_page, current_app.config.get('MAX_PAGE_SIZE', 200)))
+    return {'after': request.args.get('after'), 'before': request.args.get('before'), 'per_page': per_page}
+
+
+def paginate_request(query, columns, descending=False):
+    # `keyset_paginate()` with the cursor and page size taken from the request (see `page_request_args()`)
+    try:
+        return keyset_paginate(query, columns, descending=descending, **page_request_args())
+    except ValueError:
+        abort(400)
@@ -0,0 +1,136 @@
+from formatting import format_datetime, format_datetimes
+from models import *
+
+### Payloads
+# The dictionaries the views render, shared with the JSON API so both always
+# have the same shape. The shapes are documented in the `## DATA STRUCTURE ##`
+# blocks of the views in app.py.
+#
+# Start times are formatted once, in the format they are shown in: 'full' on the
+# pages (the templates print them as is), 'medium' in the JSON API.
+
+def show_listing_payload(show, start_time=None):
+    # A row of `shows_query()` as listed on /shows
+    return {
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": start_time if start_time is not None else format_datetime(show.start_time)
+    }
+
+
+def artist_listing_payload(artist):
+    # A row of `artists_query()` as listed on /artists
+    return {
+        "id": artist.id,
+        "name": artist.name
+    }
+
+
+def search_results_payload(rows):
+    # Venues/artists found by `find_by_name()` (search.py), as listed on /venues/search and
+    # /artists/search. The number of upcoming shows is kept on each row (see rollups.py)
+    return {
+        "count": len(rows),
+        "data": [{
+            "id": row.id,
+            "name": row.name,
+            "num_upcoming_shows": row.upcoming_shows_count
+        } for row in rows]
+    }
+
+
+def search_show_payload(show, now, start_time=None):
+    # A row of `search_shows_query()` as listed on /shows/search
+    return {
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "venue_image_link": show.venue_image_link,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "is_upComingShow": show.start_time > now,
+        "start_time": start_time if start_time is not None else format_datetime(show.start_time)
+    }
+
+
+def venue_show_payload(show, start_time=None):
+    # A row of `venue_shows_query()` as listed on the venue page
+    return {
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": start_time if start_time is not None else format_datetime(show.start_time)
+    }
+
+
+def artist_show_payload(show, start_time=None):
+    # A row of `artist_shows_query()` as listed on the artist page
+    return {
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "venue_image_link": show.venue_image_link,
+        "start_time": start_time if start_time is not None else format_datetime(show.start_time)
+    }
+
+
+def shows_page_payload(page, show_payload, format='medium'):
+    # The shows of a `KeysetPage` of `shows_page()` and the cursor of the next page (None on the last one)
+    start_times = format_datetimes([show.start_time for show in page.items], format)
+    return [show_payload(show, start_time) for show, start_time in zip(page.items, start_times)], page.next_cursor
+
+
+def venue_detail_payload(venue, counts, upcoming, past, format='medium'):
+    # The venue page: the venue, its genres, its numbers of upcoming and past shows and the first
+    # page of each. `counts`, `upcoming` and `past` come from `split_shows()` (queries.py)
+    upcoming_shows, upcoming_next = shows_page_payload(upcoming, venue_show_payload, format)
+    past_shows, past_next = shows_page_payload(past, venue_show_payload, format)
+
+    return {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": [genre.name for genre in venue.genres],
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": counts.past,
+        "upcoming_shows_count": counts.upcoming,
+        # Cursors of the next pages of shows, for /venues/<id>/shows/<upcoming|past>?after=
+        "past_shows_next": past_next,
+        "upcoming_shows_next": upcoming_next,
+    }
+
+
+def artist_detail_payload(artist, counts, upcoming, past, format='medium'):
+    # The artist page, same as `venue_detail_payload()` from the artist side
+    upcoming_shows, upcoming_next = shows_page_payload(upcoming, artist_show_payload, format)
+    past_shows, past_next = shows_page_payload(past, artist_show_payload, format)
+
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": [genre.name for genre in artist.genres],
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "image_link": artist.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": counts.past,
+        "upcoming_shows_count": counts.upcoming,
+        "past_shows_next": past_next,
+        "upcoming_shows_next": upcoming_next,
+    }
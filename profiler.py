@@ -0,0 +1,246 @@
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from itsdangerous import TimestampSigner, BadSignature
+from sqlalchemy import event
+from metrics import app_engines
+
+### On-demand Request Profiler
+# Profiles single requests in production, e.g. a slow /venues/<id>, without
+# touching any other request. With PROFILER_ENABLED = False (config.py) none of
+# this is registered, so it costs nothing.
+#
+# A request is profiled when it carries a token signed with PROFILER_SECRET,
+# in the X-Fyyur-Profile header or the ?_profile= query parameter:
+#
+#   $ flask profile-token
+#   $ curl -H "X-Fyyur-Profile: <token>" https://fyyur.example.com/venues/3
+#
+# The view (from the first before_request hook to the last after_request hook)
+# runs under a deterministic profiler that records every Python and C call
+# with its full call stack. Two files are written to PROFILER_DIR, named after
+# the endpoint and time and returned in the X-Fyyur-Profile-Id header:
+#   <id>.folded  collapsed stacks in microseconds, for flamegraph.pl or speedscope
+#   <id>.json    summary: wall time, the SQL statements with their timing,
+#                template render time and the top functions by self/total time
+#
+# Streamed responses are only profiled up to the point the view returns.
+
+TOKEN_PAYLOAD = 'profile'
+
+
+class StackProfiler(object):
+    # Deterministic profiler: time spent in each distinct call stack, through sys.setprofile()
+
+    def __init__(self):
+        self.self_times = defaultdict(float)  # stack (tuple of labels) -> seconds spent in its last frame
+        self.calls = defaultdict(int)         # label -> number of calls
+        self.labels = {}
+        self.stack = []                       # [path, started, time spent in children]
+        self.started = None
+        self.elapsed = 0.0
+
+    def label(self, frame, event, arg):
+        if event == 'call':
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                label = self.labels[code] = '%s (%s:%d)' % (code.co_name, short_path(code.co_filename), code.co_firstlineno)
+            return label
+        module = getattr(arg, '__module__', None) or 'builtins'
+        return '%s.%s' % (module, getattr(arg, '__qualname__', getattr(arg, '__name__', repr(arg))))
+
+    def callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call' or event == 'c_call':
+            label = self.label(frame, event, arg)
+            path = (self.stack[-1][0] if self.stack else ()) + (label,)
+            self.stack.append([path, now, 0.0])
+            self.calls[label] += 1
+        elif self.stack:
+            # return, c_return, c_exception. Returns from frames entered before start() have no entry
+            path, started, children = self.stack.pop()
+            total = now - started
+            self.self_times[path] += total - children
+            if self.stack:
+                self.stack[-1][2] += total
+
+    def start(self):
+        self.started = time.perf_counter()
+        sys.setprofile(self.callback)
+
+    def stop(self):
+        sys.setprofile(None)
+        self.elapsed = time.perf_counter() - self.started
+        # Frames still open (the hook that called stop()) are closed now
+        while self.stack:
+            self.callback(None, 'return', None)
+
+    def folded(self):
+        # One 'frame;frame;frame microseconds' line per stack, the input format of flamegraph.pl
+        lines = []
+        for path, seconds in sorted(self.self_times.items()):
+            microseconds = int(seconds * 1000000)
+            if microseconds:
+                lines.append('%s %d' % (';'.join(label.replace(';', ',') for label in path), microseconds))
+        return '\n'.join(lines) + '\n'
+
+    def top_functions(self, limit=25):
+        self_time = defaultdict(float)
+        total_time = defaultdict(float)
+        for path, seconds in self.self_times.items():
+            self_time[path[-1]] += seconds
+            # Recursive functions count once per stack
+            for label in set(path):
+                total_time[label] += seconds
+
+        def rows(times):
+            ranked = sorted(times.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [{'function': label, 'ms': round(seconds * 1000, 3), 'calls': self.calls[label]}
+                for label, seconds in ranked]
+
+        return {'self': rows(self_time), 'total': rows(total_time)}
+
+
+def short_path(filename):
+    # site-packages/flask/app.py -> flask/app.py, the app's own files relative to the project
+    for marker in ('site-packages' + os.sep, 'dist-packages' + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    root = os.path.dirname(os.path.abspath(__file__)) + os.sep
+    return filename[len(root):] if filename.startswith(root) else filename
+
+
+class RequestProfiler(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.signer = None
+        self.directory = None
+        self.max_age = 3600
+
+    def init_app(self, app, db):
+        self.enabled = app.config.get('PROFILER_ENABLED', False)
+        if not self.enabled:
+            return
+
+        secret = app.config.get('PROFILER_SECRET')
+        if not secret:
+            raise ValueError('PROFILER_ENABLED needs a PROFILER_SECRET to sign the profiling tokens')
+        self.signer = TimestampSigner(secret, salt='fyyur-request-profiler')
+        self.directory = app.config['PROFILER_DIR']
+        self.max_age = app.config.get('PROFILER_TOKEN_MAX_AGE', 3600)
+        os.makedirs(self.directory, exist_ok=True)
+
+        for engine in app_engines(app, db):
+            self.instrument_engine(engine)
+        before_render_template.connect(self._before_render_template, app)
+        template_rendered.connect(self._template_rendered, app)
+        # First in, last out: the profile covers the other hooks too
+        app.before_request_funcs.setdefault(None, []).insert(0, self._before_request)
+        app.after_request_funcs.setdefault(None, []).insert(0, self._after_request)
+        # Teardown runs even when the request or another after_request hook raised
+        app.teardown_request(self._teardown_request)
+
+        @app.cli.command('profile-token')
+        def profile_token_command():
+            """Prints a token that profiles the requests sending it (X-Fyyur-Profile header or ?_profile=)."""
+            print(self.make_token())
+
+    def make_token(self):
+        return self.signer.sign(TOKEN_PAYLOAD).decode('ascii')
+
+    def is_valid_token(self, token):
+        try:
+            return self.signer.unsign(token, max_age=self.max_age).decode('ascii') == TOKEN_PAYLOAD
+        except BadSignature:
+            return False
+
+    # Requests
+
+    def _before_request(self):
+        token = request.headers.get('X-Fyyur-Profile') or request.args.get('_profile')
+        if not token or not self.is_valid_token(token):
+            return
+        g.profile = {'statements': [], 'template_started': [], 'template_time': 0.0,
+            'started_at': datetime.utcnow(), 'profiler': StackProfiler()}
+        g.profile['profiler'].start()
+
+    def _after_request(self, response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        profile['profiler'].stop()
+        response.headers['X-Fyyur-Profile-Id'] = self.save(profile, response)
+        return response
+
+    def _teardown_request(self, exc):
+        # A profile still here never got to `_after_request()`: uninstalls the profiler, which would
+        # otherwise stay on the thread and slow down its next requests. Without a response, it isn't saved
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile['profiler'].stop()
+
+    def save(self, profile, response):
+        profiler = profile['profiler']
+        profile_id = '%s-%s' % (profile['started_at'].strftime('%Y%m%dT%H%M%S%f'), request.endpoint or 'unknown')
+        statements = profile['statements']
+
+        summary = {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.full_path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'started_at': profile['started_at'].isoformat() + 'Z',
+            'wall_ms': round(profiler.elapsed * 1000, 3),
+            'sql': {
+                'queries': len(statements),
+                'ms': round(sum(ms for _, ms in statements), 3),
+                'statements': [{'ms': ms, 'statement': statement} for statement, ms in statements],
+            },
+            'template_ms': round(profile['template_time'] * 1000, 3),
+            'functions': profiler.top_functions(),
+        }
+
+        path = os.path.join(self.directory, profile_id)
+        with open(path + '.folded', 'w') as f:
+            f.write(profiler.folded())
+        with open(path + '.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+        return profile_id
+
+    # SQL statements and templates of the profiled request
+
+    def instrument_engine(self, engine):
+        # Records the statements of `engine` in the profiles (see `RequestMetrics.instrument_engine()`)
+        if not self.enabled:
+            return
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'profile' in g:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'profile' in g and conn.info.get('profile_started'):
+            elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+            g.profile['statements'].append((' '.join(statement.split()), round(elapsed * 1000, 3)))
+
+    def _before_render_template(self, app, template, context, **extra):
+        if 'profile' in g:
+            g.profile['template_started'].append(time.perf_counter())
+
+    def _template_rendered(self, app, template, context, **extra):
+        if 'profile' in g and g.profile['template_started']:
+            started = g.profile['template_started'].pop()
+            if not g.profile['template_started']:
+                g.profile['template_time'] += time.perf_counter() - started
+
+
+request_profiler = RequestProfiler()
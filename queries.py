@@ -0,0 +1,136 @@
+from itertools import groupby
+from sqlalchemy import or_, select
+from sqlalchemy.orm import selectinload
+from models import *
+from pagination import keyset_paginate
+from rollups import show_counts
+
+### Read Path
+# Helpers that load everything a page needs up front, so the cost of rendering
+# a page does not grow with the number of rows it shows.
+
+def get_venue(venue_id):
+    # The venue and its genres (select-in). Its shows are counted and paged by the queries below
+    return Venue.query.options(selectinload(Venue.genres)).get(venue_id)
+
+
+def get_artist(artist_id):
+    return Artist.query.options(selectinload(Artist.genres)).get(artist_id)
+
+
+def venue_shows_query(venue_id):
+    # The venue's shows joined with the artist columns its page needs
+    return db.session.query(
+        Show.id, Show.start_time, Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Artist, Show.artist_id == Artist.id).filter(Show.venue_id == venue_id)
+
+
+def artist_shows_query(artist_id):
+    # The artist's shows joined with the venue columns its page needs
+    return db.session.query(
+        Show.id, Show.start_time, Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link')
+    ).join(Venue, Show.venue_id == Venue.id).filter(Show.artist_id == artist_id)
+
+
+def when_shows(query, when, now):
+    # `query` restricted to the 'upcoming' or 'past' shows at `now`, and whether it pages
+    # in descending order: upcoming ones soonest first, past ones most recent first
+    if when == 'upcoming':
+        return query.filter(Show.start_time > now), False
+    return query.filter(Show.start_time <= now), True
+
+
+def shows_page(query, when, now, after=None, per_page=10):
+    # A `KeysetPage` of a venue's/artist's 'upcoming' or 'past' shows (see `when_shows()`).
+    # Raises ValueError for an invalid `after` cursor
+    query, descending = when_shows(query, when, now)
+    return keyset_paginate(query, SHOWS_ORDER, after=after, per_page=per_page, descending=descending)
+
+
+def split_shows(query, owner, column, per_page):
+    # The numbers of upcoming and past shows of a venue/artist (`owner`, referred to by the Show
+    # `column`) and the first page of each, in 3 queries however many shows there are
+    now = datetime.now()
+    counts = show_counts(owner, column, now)
+    return counts, shows_page(query, 'upcoming', now, per_page=per_page), shows_page(query, 'past', now, per_page=per_page)
+
+
+def venue_areas_query():
+    # Venues with the columns the /venues listing needs, and each venue's number of
+    # upcoming shows from its rollup count (see rollups.py), so a page of the listing is one query.
+    return db.session.query(
+        Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_count.label('num_upcoming_shows')
+    )
+
+
+# Sort key of the /venues listing: venues of the same area are next to each other
+VENUE_AREAS_ORDER = (Venue.state, Venue.city, Venue.id)
+
+
+def iter_venue_areas(rows):
+    # Buckets rows of `venue_areas_query()`, sorted by `VENUE_AREAS_ORDER`,
+    # by (city, state) in a single pass, yielding one area at a time
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        yield {
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': venue.id,
+                'name': venue.name,
+                'num_upcoming_shows': venue.num_upcoming_shows
+            } for venue in venues]
+        }
+
+
+def group_venue_areas(rows):
+    return list(iter_venue_areas(rows))
+
+
+def shows_query():
+    # Shows joined with the venue and artist columns the /shows listing needs,
+    # so a page of shows is one query instead of two lazy loads per show.
+    # The `updated_at`s version the cached rows of the page (see template_cache.py)
+    return db.session.query(
+        Show.id, Show.start_time, Show.venue_id, Show.artist_id,
+        Venue.name.label('venue_name'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.updated_at, Venue.updated_at.label('venue_updated_at'), Artist.updated_at.label('artist_updated_at')
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+
+
+# Sort key of the /shows listing (most recent first)
+SHOWS_ORDER = (Show.start_time, Show.id)
+
+
+def search_shows_query(search_term, venue_ids=None, artist_ids=None):
+    # Shows whose venue name, artist name, or a genre of their venue or artist contains
+    # `search_term`, with the columns of `shows_query()` and the venue image, as one statement.
+    # Each kind of match is a subquery of ids (served by the trigram indexes on PostgreSQL),
+    # and the shows of those ids are read through the Show indexes. `venue_ids`/`artist_ids`
+    # replace the name matches when they come from the in-process search index (search_index.py)
+    pattern = '%' + search_term + '%'
+    if venue_ids is None:
+        venue_ids = select(Venue.id).where(Venue.name.ilike(pattern))
+    if artist_ids is None:
+        artist_ids = select(Artist.id).where(Artist.name.ilike(pattern))
+    genre_ids = select(Genre.id).where(Genre.name.ilike(pattern))
+
+    return shows_query().add_columns(Venue.image_link.label('venue_image_link')).filter(or_(
+        Show.venue_id.in_(venue_ids),
+        Show.artist_id.in_(artist_ids),
+        Show.venue_id.in_(select(genres_venues.c.venue_id).where(genres_venues.c.genre_id.in_(genre_ids))),
+        Show.artist_id.in_(select(genres_artists.c.artist_id).where(genres_artists.c.genre_id.in_(genre_ids))),
+    ))
+
+
+def artists_query():
+    return db.session.query(Artist.id, Artist.name)
+
+
+# Sort key of the /artists listing
+ARTISTS_ORDER = (Artist.name, Artist.id)
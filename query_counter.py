@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+
+### Query Counter
+# Counts the SQL statements sent to the database while a block of code runs.
+# Used to keep the read paths in `queries.py` from sliding back into N+1 queries.
+#
+# Usage:
+#   with QueryCounter(db.engine) as counter:
+#     client.get('/venues/1')
+#   print(counter.count, counter.statements)
+#
+#   with assert_max_queries(db.engine, 3):
+#     client.get('/venues/1')
+#
+# bench/bench_routes.py holds the detail pages to their budget (QUERY_BUDGETS).
+
+class QueryCounter(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+
+class TooManyQueries(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    # Fails with `TooManyQueries` (listing the statements) if the block runs more than `limit` queries
+    with QueryCounter(engine) as counter:
+        yield counter
+
+    if counter.count > limit:
+        raise TooManyQueries(
+            'Expected at most %d queries, but %d were executed:\n%s'
+            % (limit, counter.count, '\n'.join(counter.statements))
+        )
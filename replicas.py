@@ -0,0 +1,98 @@
+import inspect
+import random
+from functools import wraps
+from flask import g, request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+### Read Replicas
+# Sends the queries of the read-only views (the listings, detail pages and
+# searches, marked with @replicas.read_only) to a read replica, and everything
+# else, including the create/edit submissions, to the primary database.
+#
+# The replicas are Flask-SQLAlchemy binds (config.py):
+#   SQLALCHEMY_BINDS = {'replica': 'postgresql://...'}
+#   REPLICA_BINDS = ['replica']
+# Each read-only request picks one of REPLICA_BINDS at random. With no
+# REPLICA_BINDS every query goes to the primary, as before.
+#
+# Read-your-writes: a request that writes to the primary sets a cookie, and for
+# REPLICA_STICKY_SECONDS afterwards that browser reads from the primary too, so
+# a submitted venue shows up on the page it is redirected to even while the
+# replicas are still catching up.
+
+STICKY_COOKIE = 'fyyur_primary'
+
+
+class RoutingSession(SignallingSession):
+    # Session that reads from the replica chosen for the current request
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        bind = g.get('replica_bind') if has_request_context() else None
+        # Flushes always go to the primary
+        if bind is not None and not self._flushing:
+            return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind=bind)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def mark_primary_write(session, flush_context):
+    if has_request_context():
+        g.wrote_primary = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReadReplicas(object):
+
+    def __init__(self):
+        self.binds = []
+        self.sticky_seconds = 10
+
+    def init_app(self, app):
+        self.binds = list(app.config.get('REPLICA_BINDS') or [])
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 10)
+        configured = app.config.get('SQLALCHEMY_BINDS') or {}
+        for bind in self.binds:
+            if bind not in configured:
+                raise ValueError('REPLICA_BINDS names %r, which is not in SQLALCHEMY_BINDS' % bind)
+        if not self.binds:
+            return
+
+        app.after_request(self._after_request)
+
+    @property
+    def enabled(self):
+        return bool(self.binds)
+
+    def read_only(self, view):
+        # Runs the view's queries on a replica, unless this browser wrote to the primary recently.
+        # The view can be a coroutine (see async_views.py)
+        if inspect.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                self._choose_bind()
+                return await view(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            self._choose_bind()
+            return view(*args, **kwargs)
+        return wrapper
+
+    def _choose_bind(self):
+        if self.binds and not request.cookies.get(STICKY_COOKIE):
+            g.replica_bind = random.choice(self.binds)
+
+    def _after_request(self, response):
+        if g.get('wrote_primary'):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+
+replicas = ReadReplicas()
@@ -0,0 +1,142 @@
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import bindparam, event, func, select
+from models import *
+
+### Show Count Rollups
+# `upcoming_shows_count` and `past_shows_count` of Venue and Artist hold the
+# numbers of shows of each venue/artist, so the listings and searches read them
+# from the row instead of counting its shows.
+#
+# The counts are as of a watermark, the `rolled_at` of the 'show_counts' Rollup
+# row: a show is counted as upcoming when it starts after the watermark.
+#   - new shows are counted in the transaction that inserts them, against the
+#     watermark (`count_new_shows()`)
+#   - `flask roll-show-counts`, run every few minutes (e.g. from cron), moves the
+#     shows that started since the watermark from upcoming to past, and moves the
+#     watermark to now (`roll_show_counts()`)
+#   - `flask roll-show-counts --rebuild` counts every show again
+#
+# So the counts on the listings lag behind the clock by at most the roll interval.
+# The detail pages add the shows that started since the watermark (`show_counts()`),
+# which only reads the few index entries between the watermark and now.
+#
+# The 'show_counts' row is seeded with the time the Rollup table is created: by
+# the migration that adds the counts, which counts the existing shows at that
+# time, or by `db.create_all()` (`seed_rollups()`), when there are no shows yet.
+# Without the row (e.g. deleted by hand), the watermark is `datetime.min`: every
+# show is counted as upcoming until the next roll, which builds the counts from
+# scratch.
+
+NAME = 'show_counts'
+
+ShowCounts = namedtuple('ShowCounts', ['upcoming', 'past'])
+
+# (model, the Show column referring to it)
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+
+@event.listens_for(Rollup.__table__, 'after_create')
+def seed_rollups(table, connection, **kw):
+    # `db.create_all()` makes empty tables, whose counts (0) are right as of now
+    connection.execute(table.insert().values(name=NAME, rolled_at=datetime.now()))
+
+
+def watermark(lock=False):
+    # `rolled_at` of the show counts. With `lock`, held until the end of the transaction
+    # (FOR SHARE on PostgreSQL), so a roll can't move the watermark under a new show
+    query = db.session.query(Rollup.rolled_at).filter(Rollup.name == NAME)
+    if lock:
+        query = query.with_for_update(read=True)
+    rolled_at = query.scalar()
+    return rolled_at if rolled_at is not None else datetime.min
+
+
+def add_counts(model, deltas, touch=True):
+    # Adds {id: (upcoming, past)} to the counts of `model` rows, in one executemany.
+    # Without `touch`, `updated_at` is left as it is (see exporter.py)
+    table = model.__table__
+    values = {
+        'upcoming_shows_count': table.c.upcoming_shows_count + bindparam('_upcoming'),
+        'past_shows_count': table.c.past_shows_count + bindparam('_past'),
+    }
+    if not touch:
+        values['updated_at'] = table.c.updated_at
+    rows = [{'_id': id, '_upcoming': upcoming, '_past': past} for id, (upcoming, past) in deltas.items()
+        if upcoming or past]
+    if rows:
+        db.session.execute(table.update().where(table.c.id == bindparam('_id')).values(values), rows)
+
+
+def count_new_shows(shows):
+    # Counts new shows, given as (venue_id, artist_id, start_time), in the caller's transaction
+    since = watermark(lock=True)
+    deltas = {Venue: {}, Artist: {}}
+    for venue_id, artist_id, start_time in shows:
+        for model, id in ((Venue, venue_id), (Artist, artist_id)):
+            upcoming, past = deltas[model].get(id, (0, 0))
+            deltas[model][id] = (upcoming + 1, past) if start_time > since else (upcoming, past + 1)
+
+    for model, _ in OWNERS:
+        add_counts(model, deltas[model])
+
+
+def roll_show_counts(now=None):
+    # Moves the shows that started since the watermark from upcoming to past and commits.
+    # Returns the number of shows moved. The first roll builds the counts instead
+    now = now or datetime.now()
+    rollup = db.session.query(Rollup).filter(Rollup.name == NAME).with_for_update().one_or_none()
+    if rollup is None:
+        rebuild_show_counts(now)
+        return 0
+
+    moved = 0
+    if now > rollup.rolled_at:
+        for model, column in OWNERS:
+            rows = db.session.query(column, func.count(Show.id)).filter(
+                Show.start_time > rollup.rolled_at, Show.start_time <= now).group_by(column)
+            deltas = dict((id, (-count, count)) for id, count in rows)
+            add_counts(model, deltas, touch=False)
+            if model is Venue:
+                moved = sum(count for _, count in deltas.values())
+        rollup.rolled_at = now
+    db.session.commit()
+    return moved
+
+
+def rebuild_show_counts(now=None):
+    # Counts every show again, sets the watermark to `now` and commits. Returns the number of shows
+    now = now or datetime.now()
+    # Waits for a roll in progress, and makes the next ones wait for this one
+    rollup = db.session.query(Rollup).filter(Rollup.name == NAME).with_for_update().one_or_none()
+    for model, column in OWNERS:
+        table = model.__table__
+        shows = select(func.count(Show.id)).where(column == table.c.id)
+        db.session.execute(table.update().values(
+            upcoming_shows_count=shows.where(Show.start_time > now).scalar_subquery(),
+            past_shows_count=shows.where(Show.start_time <= now).scalar_subquery(),
+            updated_at=table.c.updated_at,
+        ))
+    if rollup is None:
+        db.session.add(Rollup(name=NAME, rolled_at=now))
+    else:
+        rollup.rolled_at = now
+    db.session.commit()
+    return db.session.query(func.count(Show.id)).scalar()
+
+
+def started_shows(column, owner_id, now):
+    # Query of the number of shows of a venue/artist that started between the watermark and `now`.
+    # `column` is the Show column referring to it (Show.venue_id or Show.artist_id)
+    since = select(func.coalesce(func.max(Rollup.rolled_at), datetime.min)).where(Rollup.name == NAME).scalar_subquery()
+    return db.session.query(func.count(Show.id)).filter(
+        column == owner_id, Show.start_time > since, Show.start_time <= now)
+
+
+def show_counts(owner, column, now, started=None):
+    # `ShowCounts` of a venue/artist at `now`: its rollup counts, with the shows that
+    # started between the watermark and `now` moved to past. `started` is the result
+    # of `started_shows()` when the caller already ran it
+    if started is None:
+        started = started_shows(column, owner.id, now).scalar()
+    return ShowCounts(owner.upcoming_shows_count - started, owner.past_shows_count + started)
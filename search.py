@@ -0,0 +1,99 @@
+import sqlite3
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+from search_index import search_indexes
+
+### Name Search
+# Case-insensitive partial search on `Venue.name` / `Artist.name`.
+#
+# SEARCH_MODE (config.py):
+#   'trigram'   - `name ILIKE '%term%'` ranked by trigram similarity to the search term.
+#                 On PostgreSQL both are served by the pg_trgm GIN indexes
+#                 (migration df8a04d05c44).
+#   'substring' - plain `name ILIKE '%term%'`, unranked.
+#
+# SQLite has no pg_trgm, so a `similarity()` SQL function with the same
+# semantics is registered on every SQLite connection. That keeps the query
+# (and the ranking) identical when benchmarking locally, only without the index.
+#
+# With SEARCH_INDEX_ENABLED, `find_by_name()` matches names against the
+# in-process n-gram index (search_index.py) instead, and only loads the matched
+# rows by primary key.
+
+def find_by_name(model, index, search_term):
+    # Returns the `model` rows whose name contains `search_term`, best matches first
+    query, ids = name_search_query(model, index, search_term)
+    return rank_by_ids(query.all() if query is not None else [], ids)
+
+
+def name_search_query(model, index, search_term):
+    # The query of `find_by_name()`, and the ids of the search index matches, best first, that
+    # its rows are ranked by (None when the query ranks them). No query when the index matched nothing
+    if not search_indexes.enabled:
+        return search_by_name(model, search_term), None
+
+    search_indexes.ensure_built()
+    ids = [id for (id, _) in index.search(search_term)]
+    if not ids:
+        return None, ids
+    return model.query.filter(model.id.in_(ids)), ids
+
+
+def rank_by_ids(rows, ids):
+    if ids is None:
+        return rows
+    rows = dict((row.id, row) for row in rows)
+    return [rows[id] for id in ids if id in rows]
+
+
+def indexed_show_search_ids(search_term):
+    # (venue ids, artist ids) whose names match `search_term` in the search index,
+    # for `search_shows_query()` (queries.py). (None, None) when the index is disabled
+    if not search_indexes.enabled:
+        return None, None
+    search_indexes.ensure_built()
+    return ([id for (id, _) in search_indexes.venues.search(search_term)],
+        [id for (id, _) in search_indexes.artists.search(search_term)])
+
+
+def search_by_name(model, search_term):
+    # Returns a query of `model` rows whose name contains `search_term`
+    pattern = '%' + search_term + '%'
+    query = model.query.filter(model.name.ilike(pattern))
+
+    if current_app.config.get('SEARCH_MODE', 'substring') == 'trigram':
+        query = query.order_by(func.similarity(model.name, search_term).desc(), model.name)
+
+    return query
+
+
+def trigrams(text):
+    # Trigrams of `text` the way pg_trgm builds them: lower-cased, split into words
+    # on non-alphanumeric characters, each word padded with two spaces in front and one behind
+    result = set()
+    word = []
+    for char in (text or '').lower() + ' ':
+        if char.isalnum():
+            word.append(char)
+        elif word:
+            padded = '  ' + ''.join(word) + ' '
+            for i in range(len(padded) - 2):
+                result.add(padded[i:i + 3])
+            word = []
+    return result
+
+
+def trigram_similarity(a, b):
+    # pg_trgm's similarity(): shared trigrams / all distinct trigrams, between 0 and 1
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return float(shared) / (len(a) + len(b) - shared)
+
+
+@event.listens_for(Engine, 'connect')
+def register_sqlite_similarity(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('similarity', 2, trigram_similarity)
@@ -0,0 +1,276 @@
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import timedelta
+
+### In-Process Search Index
+# An n-gram inverted index over venue and artist names, so partial-match
+# searches are answered from memory instead of an ILIKE scan in the database.
+#
+# Every name is lower-cased and split into overlapping n-grams ("musical" ->
+# "mus", "usi", "sic", "ica", "cal"). Each n-gram maps to a compact array of the
+# ids whose name contains it. A search takes the n-gram of the search term with
+# the shortest id array and checks those candidates against the full term.
+#
+# Updates are incremental: `add()` appends to the arrays and `remove()` only forgets
+# the name. Ids left behind in the arrays are filtered out when searching and
+# dropped by `compact()` once they make up half of all entries.
+#
+# Each worker process holds its own copy (SEARCH_INDEX_ENABLED in config.py),
+# built by its first search. The create/edit submissions it serves update it
+# at once. The changes committed by other processes (other workers,
+# `flask import-data`) are picked up by the searches: at most every
+# SEARCH_INDEX_CHECK_INTERVAL seconds, one query compares the number of venues
+# and artists and their latest `updated_at` with the ones the index was brought
+# up to, and the rows changed since are added again. Rows stamped up to
+# COMMIT_WINDOW before that `updated_at` are read again too, as a row is stamped
+# before its transaction commits. A lower count (a deleted row) rebuilds the index.
+#
+# `flask rebuild-search-index` builds an index in the CLI process, to print its
+# stats; it doesn't change the workers' copies.
+
+class NgramIndex(object):
+
+    def __init__(self, n=3, max_latencies=1000):
+        self.n = n
+        self.names = {}     # id -> name, as displayed
+        self.keys = {}      # id -> lower-cased name, as matched
+        self.postings = {}  # n-gram -> array of ids
+        self.stale_entries = 0
+        self.live_entries = 0
+        self.lock = threading.RLock()
+        self.latencies = deque(maxlen=max_latencies)
+        self.searches = 0
+        self.built_at = None
+        self.build_seconds = None
+
+    def ngrams(self, key):
+        return set(key[i:i + self.n] for i in range(len(key) - self.n + 1))
+
+    def build(self, rows):
+        # (Re)builds the index from an iterable of (id, name) rows
+        started = time.time()
+        with self.lock:
+            self.names, self.keys, self.postings = {}, {}, {}
+            self.stale_entries = self.live_entries = 0
+            for id, name in rows:
+                self._add(id, name)
+            self.built_at = time.time()
+            self.build_seconds = self.built_at - started
+
+    def add(self, id, name):
+        # Adds a new name, or replaces the name stored for `id`
+        with self.lock:
+            if id in self.keys:
+                self._remove(id)
+            self._add(id, name)
+            self._maybe_compact()
+
+    def remove(self, id):
+        with self.lock:
+            if id in self.keys:
+                self._remove(id)
+                self._maybe_compact()
+
+    def _add(self, id, name):
+        key = name.lower()
+        self.names[id] = name
+        self.keys[id] = key
+        for gram in self.ngrams(key):
+            ids = self.postings.get(gram)
+            if ids is None:
+                ids = self.postings[gram] = array('I')
+            ids.append(id)
+            self.live_entries += 1
+
+    def _remove(self, id):
+        entries = len(self.ngrams(self.keys[id]))
+        self.live_entries -= entries
+        self.stale_entries += entries
+        del self.names[id]
+        del self.keys[id]
+
+    def _maybe_compact(self):
+        if self.stale_entries > self.live_entries:
+            self.compact()
+
+    def compact(self):
+        # Rebuilds the id arrays from the names currently stored
+        with self.lock:
+            self.build(list(self.names.items()))
+
+    def search(self, term, limit=None):
+        # Returns [(id, name)] of names containing `term` (case-insensitive),
+        # best matches first: earliest match, then shortest name
+        started = time.time()
+        term = term.strip().lower()
+
+        with self.lock:
+            if len(term) < self.n:
+                # Too short to have an n-gram, check every name
+                candidates = self.keys.keys()
+            else:
+                grams = self.ngrams(term)
+                if any(gram not in self.postings for gram in grams):
+                    candidates = ()
+                else:
+                    candidates = set(min((self.postings[gram] for gram in grams), key=len))
+
+            matches = []
+            for id in candidates:
+                key = self.keys.get(id)
+                if key is not None:
+                    position = key.find(term)
+                    if position != -1:
+                        matches.append((position, len(key), key, id))
+
+            matches.sort()
+            if limit is not None:
+                matches = matches[:limit]
+            results = [(id, self.names[id]) for (_, _, _, id) in matches]
+
+        self.searches += 1
+        self.latencies.append(time.time() - started)
+        return results
+
+    def memory_bytes(self):
+        # Approximate size of the index in bytes: containers, id arrays and strings
+        with self.lock:
+            size = sys.getsizeof(self.names) + sys.getsizeof(self.keys) + sys.getsizeof(self.postings)
+            for gram, ids in self.postings.items():
+                size += sys.getsizeof(gram) + sys.getsizeof(ids)
+            for id in self.names:
+                size += sys.getsizeof(id) + sys.getsizeof(self.names[id]) + sys.getsizeof(self.keys[id])
+            return size
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+
+        return {
+            'names': len(self.names),
+            'ngrams': len(self.postings),
+            'live_entries': self.live_entries,
+            'stale_entries': self.stale_entries,
+            'memory_bytes': self.memory_bytes(),
+            'build_seconds': self.build_seconds,
+            'searches': self.searches,
+            'latency_ms_p50': percentile(0.50),
+            'latency_ms_p99': percentile(0.99),
+            'latency_ms_max': percentile(1.0),
+        }
+
+
+# Rows stamped this long before the latest `updated_at` an index holds are read again when it is
+# brought up to date, for the transactions that committed after stamping them
+COMMIT_WINDOW = timedelta(seconds=60)
+
+
+class SearchIndexes(object):
+    # The name indexes used by the search routes, one per searchable table
+
+    def __init__(self):
+        self.venues = NgramIndex()
+        self.artists = NgramIndex()
+        self.enabled = False
+        self.built = False
+        self.versions = None  # [(rows, latest updated_at)] of the tables, as the indexes hold them
+        self.checked_at = 0
+        self.check_interval = 5
+        self.refreshes = 0
+        self.lock = threading.RLock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SEARCH_INDEX_ENABLED', False)
+        self.check_interval = app.config.get('SEARCH_INDEX_CHECK_INTERVAL', 5)
+
+    def tables(self):
+        from models import Venue, Artist
+        return [(Venue, self.venues), (Artist, self.artists)]
+
+    def read_versions(self, connection):
+        # [(number of rows, latest updated_at)] of each table, in one query
+        from sqlalchemy import func, select
+        columns = []
+        for model, _ in self.tables():
+            columns += [select(func.count()).select_from(model).scalar_subquery(),
+                select(func.max(model.updated_at)).scalar_subquery()]
+        row = connection.execute(select(*columns)).one()
+        return [tuple(row[i:i + 2]) for i in range(0, len(row), 2)]
+
+    def rebuild(self):
+        from models import db
+        from sqlalchemy import select
+        with self.lock, db.engine.connect() as connection:
+            # Read first: a change committed during the build is picked up by the next check
+            self.versions = self.read_versions(connection)
+            for model, index in self.tables():
+                index.build(connection.execution_options(stream_results=True)
+                    .execute(select(model.id, model.name)))
+            self.built = True
+            self.checked_at = time.time()
+
+    def refresh(self):
+        # Adds the rows changed since the indexes were built or last refreshed, rebuilds an
+        # index whose table lost rows
+        from models import db
+        from sqlalchemy import select
+        with self.lock, db.engine.connect() as connection:
+            versions = self.read_versions(connection)
+            for (model, index), (count, latest), old in zip(self.tables(), versions, self.versions):
+                if (count, latest) == old:
+                    continue
+                query = select(model.id, model.name)
+                if old[1] is not None:
+                    query = query.where(model.updated_at >= old[1] - COMMIT_WINDOW)
+                for id, name in connection.execute(query):
+                    index.add(id, name)
+                if len(index.names) != count:
+                    index.build(connection.execution_options(stream_results=True)
+                        .execute(select(model.id, model.name)))
+            self.versions = versions
+            self.refreshes += 1
+            self.checked_at = time.time()
+
+    def ensure_built(self):
+        # Builds the indexes on the worker's first search, and brings them up to date with the other
+        # processes' changes at most every `check_interval` seconds. The searches arriving meanwhile wait
+        if self.built and time.time() < self.checked_at + self.check_interval:
+            return
+        with self.lock:
+            if not self.built:
+                self.rebuild()
+            elif time.time() >= self.checked_at + self.check_interval:
+                self.refresh()
+
+    # Called by the create/edit submissions once their changes are committed. Before the first
+    # search there is nothing to update: the build reads the committed names. The lock makes an
+    # update committed during the build wait for it, instead of being overwritten by its rows
+
+    def add_venue(self, id, name):
+        if self.enabled:
+            with self.lock:
+                if self.built:
+                    self.venues.add(id, name)
+
+    def add_artist(self, id, name):
+        if self.enabled:
+            with self.lock:
+                if self.built:
+                    self.artists.add(id, name)
+
+    def stats(self):
+        return {
+            'venues': self.venues.stats(),
+            'artists': self.artists.stats(),
+            'refreshes': self.refreshes,
+        }
+
+
+search_indexes = SearchIndexes()
@@ -2,3 +2,32 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// "Load more" links of the venue/artist pages: fetches the next show tiles
+// (?partial=1 renders only the tiles) and puts them in place of the link.
+document.addEventListener('click', function (event) {
+  var link = event.target.closest && event.target.closest('a[data-load-more]');
+  if (!link || !window.fetch) {
+    return;
+  }
+  event.preventDefault();
+  var url = new URL(link.href, window.location.href);
+  url.searchParams.set('partial', '1');
+  link.classList.add('disabled');
+  fetch(url.toString(), { credentials: 'same-origin' })
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      var container = link.parentNode;
+      container.insertAdjacentHTML('afterend', html);
+      container.parentNode.removeChild(container);
+    })
+    .catch(function () {
+      // Fall back to the page of the next shows
+      window.location.href = link.href;
+    });
+});
@@ -0,0 +1,70 @@
+import json
+from flask import Response, request, stream_with_context
+
+### Streaming JSON
+# Responses for the /api endpoints that are written while the rows are read
+# from the database, so a full export runs in constant memory and the first
+# byte goes out as soon as the first row arrives.
+#
+#   ?format=ndjson (or Accept: application/x-ndjson) - one JSON object per line
+#   otherwise                                         - a JSON array
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Items are sent in chunks of about this many bytes (the first item on its own)
+CHUNK_SIZE = 64 * 1024
+
+
+def stream_query(query, batch_size=1000):
+    # Iterates over `query` with a server-side cursor, `batch_size` rows at a time,
+    # instead of loading every row first
+    return query.yield_per(batch_size)
+
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes[NDJSON_MIMETYPE] > request.accept_mimetypes['application/json']
+
+
+def dumps(item):
+    return json.dumps(item, default=str, separators=(',', ':'))
+
+
+def generate_ndjson(items):
+    chunk = []
+    size = 0
+    first = True
+    for item in items:
+        line = dumps(item) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if first or size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size, first = [], 0, False
+    if chunk:
+        yield ''.join(chunk)
+
+
+def generate_json_array(items):
+    yield '['
+    chunk = []
+    size = 0
+    separator = ''
+    for item in items:
+        text = separator + dumps(item)
+        separator = ','
+        chunk.append(text)
+        size += len(text)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+def json_stream_response(items):
+    # Streams `items` (any iterable of JSON-serializable objects) as NDJSON or a JSON array
+    if wants_ndjson():
+        return Response(stream_with_context(generate_ndjson(items)), mimetype=NDJSON_MIMETYPE)
+    return Response(stream_with_context(generate_json_array(items)), mimetype='application/json')
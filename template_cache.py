@@ -0,0 +1,102 @@
+import hashlib
+import os
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from page_cache import LRUBackend
+
+### Template Caches
+# Bytecode cache: Jinja compiles each template to Python code the first time a
+# worker renders it. The compiled code is kept in JINJA_BYTECODE_CACHE_DIR,
+# shared by every worker on the host and kept across restarts, so a cold worker
+# loads it instead of compiling again (`flask compile-templates` fills it on
+# deploy). Entries are keyed by the template's source, so an edited template is
+# compiled again.
+#
+# Fragment cache: the rows of the /shows listing (shows.html) are rendered once
+# per version of what they show, and reused by every request listing them:
+#
+#   {% cache 'show', versions[loop.index0] %} ...row markup... {% endcache %}
+#
+# where the view passes, in the order of the rows, the show id and the
+# `updated_at` of the show, its venue and its artist (the edit submissions set
+# them). The key is the block (template, line and source, so an edited template
+# doesn't reuse old fragments) and the tag's arguments. A changed row gets a new
+# key, and the old fragment is evicted in its own time. The rows of /venues and
+# /artists are a name and a link, rendered faster than they are looked up, so
+# they aren't cached. Fragments are kept per worker in an LRU
+# of FRAGMENT_CACHE_MAX_ENTRIES entries (0 disables it).
+
+# Seconds a fragment is kept. Versioned keys never go stale; this only ages out rows nobody lists
+FRAGMENT_TIMEOUT = 24 * 3600
+
+
+class FragmentCacheExtension(Extension):
+    # The {% cache key... %} ... {% endcache %} tag
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        block = '%s:%d:%s' % (parser.name, lineno, self.source_digest(parser.name))
+        call = self.call_method('_cached', [nodes.Const(block), nodes.Tuple(key, 'load')])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def source_digest(self, name):
+        if name is None:
+            return ''
+        source = self.environment.loader.get_source(self.environment, name)[0]
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+    def _cached(self, block, key, caller):
+        return template_cache.fragment((block,) + key, caller)
+
+
+class TemplateCache(object):
+
+    def __init__(self):
+        self.fragments = None
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        directory = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+        max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000)
+        self.fragments = LRUBackend(max_entries) if max_entries else None
+        app.jinja_env.add_extension(FragmentCacheExtension)
+
+    def fragment(self, key, render):
+        # The markup of `key`, rendered by `render()` when not cached
+        if self.fragments is None:
+            return render()
+        markup = self.fragments.get(key)
+        if markup is None:
+            markup = render()
+            self.fragments.set(key, markup, FRAGMENT_TIMEOUT)
+            self.misses += 1
+        else:
+            self.hits += 1
+        return markup
+
+    def compile_templates(self, app):
+        # Compiles every template into the bytecode cache; returns their number
+        names = app.jinja_env.list_templates()
+        for name in names:
+            app.jinja_env.get_template(name)
+        return len(names)
+
+    def stats(self):
+        return {
+            'entries': self.fragments.size() if self.fragments else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.fragments.evictions if self.fragments else 0,
+        }
+
+
+template_cache = TemplateCache()